@@ -0,0 +1,98 @@
+#
+# The ElementTree toolkit is
+#
+# Copyright (c) 1999-2007 by Fredrik Lundh
+#               2008-2010 Bastian Blank <bblank@thinkmo.de>
+#
+# By obtaining, using, and/or copying this software and/or its
+# associated documentation, you agree that you have read, understood,
+# and will comply with the following terms and conditions:
+#
+# Permission to use, copy, modify, and distribute this software and
+# its associated documentation for any purpose and without fee is
+# hereby granted, provided that the above copyright notice appears in
+# all copies, and that both that copyright notice and this permission
+# notice appear in supporting documentation, and that the name of
+# Secret Labs AB or the author not be used in advertising or publicity
+# pertaining to distribution of the software without specific, written
+# prior permission.
+#
+# SECRET LABS AB AND THE AUTHOR DISCLAIMS ALL WARRANTIES WITH REGARD
+# TO THIS SOFTWARE, INCLUDING ALL IMPLIED WARRANTIES OF MERCHANT-
+# ABILITY AND FITNESS.  IN NO EVENT SHALL SECRET LABS AB OR THE AUTHOR
+# BE LIABLE FOR ANY SPECIAL, INDIRECT OR CONSEQUENTIAL DAMAGES OR ANY
+# DAMAGES WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS,
+# WHETHER IN AN ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS
+# ACTION, ARISING OUT OF OR IN CONNECTION WITH THE USE OR PERFORMANCE
+# OF THIS SOFTWARE.
+# --------------------------------------------------------------------
+
+##
+# Helpers for parsing slices of a source document, shared by the lazy,
+# incremental and parallel parsers.
+##
+
+
+def _escape_attrib(value):
+    return value.replace("&", "&amp;").replace("<", "&lt;").replace('"', "&quot;")
+
+
+def bind(namespaces, prefix, uri):
+    """
+    Returns the namespace context with a new declaration of a prefix,
+    which replaces an outer declaration of the same prefix.
+
+    @param namespaces: (prefix, uri) of the namespace declarations in scope
+    @param prefix: the declared prefix, "" for the default namespace
+    """
+    return tuple(item for item in namespaces if item[0] != prefix) + ((prefix, uri), )
+
+
+def wrapper(entities, namespaces):
+    """
+    Returns the markup around a slice of a document, so it is parsed
+    within the same entity and namespace context.
+
+    @param entities: (name, value) of the internal entities
+    @param namespaces: (prefix, uri) of the namespace declarations in scope
+    @return: the encoded text before and after the slice
+    """
+    head = []
+    if entities:
+        head.append("<!DOCTYPE _ [")
+        for name, value in entities:
+            value = value.replace("%", "&#37;").replace('"', "&#34;")
+            head.append('<!ENTITY {} "{}">'.format(name, value))
+        head.append("]>")
+    head.append("<_")
+    # one declaration per prefix, the innermost one
+    for prefix, uri in dict(namespaces).items():
+        if prefix:
+            head.append(' xmlns:{}="{}"'.format(prefix, _escape_attrib(uri)))
+        else:
+            head.append(' xmlns="{}"'.format(_escape_attrib(uri)))
+    head.append(">")
+    return "".join(head).encode("ascii", "xmlcharrefreplace"), b"</_>"
+
+
+def tag_end(data, pos):
+    """
+    Returns the position after the start tag at pos, skipping over quoted
+    attribute values, which may contain ">".
+
+    @raise ValueError: the tag does not end within data
+    """
+    end = data.find(b">", pos)
+    if end >= 0 and b'"' not in data[pos:end] and b"'" not in data[pos:end]:
+        return end + 1
+    quote = None
+    for i in range(pos + 1, len(data)):
+        c = data[i]
+        if quote is not None:
+            if c == quote:
+                quote = None
+        elif c == 0x22 or c == 0x27:
+            quote = c
+        elif c == 0x3e:
+            return i + 1
+    raise ValueError("unterminated tag")
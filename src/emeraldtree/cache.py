@@ -0,0 +1,400 @@
+#
+# The ElementTree toolkit is
+#
+# Copyright (c) 1999-2007 by Fredrik Lundh
+#               2008-2010 Bastian Blank <bblank@thinkmo.de>
+#
+# By obtaining, using, and/or copying this software and/or its
+# associated documentation, you agree that you have read, understood,
+# and will comply with the following terms and conditions:
+#
+# Permission to use, copy, modify, and distribute this software and
+# its associated documentation for any purpose and without fee is
+# hereby granted, provided that the above copyright notice appears in
+# all copies, and that both that copyright notice and this permission
+# notice appear in supporting documentation, and that the name of
+# Secret Labs AB or the author not be used in advertising or publicity
+# pertaining to distribution of the software without specific, written
+# prior permission.
+#
+# SECRET LABS AB AND THE AUTHOR DISCLAIMS ALL WARRANTIES WITH REGARD
+# TO THIS SOFTWARE, INCLUDING ALL IMPLIED WARRANTIES OF MERCHANT-
+# ABILITY AND FITNESS.  IN NO EVENT SHALL SECRET LABS AB OR THE AUTHOR
+# BE LIABLE FOR ANY SPECIAL, INDIRECT OR CONSEQUENTIAL DAMAGES OR ANY
+# DAMAGES WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS,
+# WHETHER IN AN ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS
+# ACTION, ARISING OUT OF OR IN CONNECTION WITH THE USE OR PERFORMANCE
+# OF THIS SOFTWARE.
+# --------------------------------------------------------------------
+
+##
+# Content-addressed caches for parsed documents and serialized subtrees.
+##
+
+import copy
+import hashlib
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+from . import tree
+
+
+class ParseCache:
+    """
+    LRU cache of parsed documents.
+
+    Entries are keyed by a digest of the input data and the parser
+    factory, so the same source parsed with a different parser
+    configuration is cached separately.  The cache is bounded by the
+    estimated memory size of the cached trees, not by the number of
+    entries.
+
+    By default every lookup hands out a copy of the cached tree, which
+    shares only the immutable strings with it.  With copy=False the cached
+    tree itself is returned; it is shared between all users and must not
+    be modified.
+
+    @ivar hits: number of lookups served from the cache
+    @ivar misses: number of lookups that had to parse
+    @ivar size: estimated memory size of all cached trees in bytes
+    """
+
+    def __init__(self, max_size=64 * 1024 * 1024, copy=True):
+        self.max_size = max_size
+        self.copy = copy
+        self.hits = self.misses = 0
+        self.size = 0
+        self._entries = OrderedDict() # key -> (root, size)
+        self._files = {} # file name -> (stat key, digest)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._files.clear()
+            self.size = 0
+
+    def stats(self):
+        """
+        Returns a dictionary with the hit/miss counters and the cache size.
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+                "size": self.size,
+            }
+
+    def XML(self, text, parser=None):
+        """
+        Parses an XML document from a string, like tree.XML.
+
+        @param text: str or bytes containing the document
+        @param parser: callable returning a new parser instance, defaults to
+            tree.XMLParser.  It is part of the cache key, so pass the same
+            object for the same configuration.
+        @return: the root element
+        """
+        if parser is None:
+            parser = tree.XMLParser
+        return self._lookup(_digest(text), parser, (text, ))
+
+    fromstring = XML
+
+    def parse(self, source, parser=None, check_mtime=False):
+        """
+        Parses an XML document from a file, like tree.parse.
+
+        @param source: file name or file object
+        @param parser: parser factory, see XML
+        @param check_mtime: for file names, reuse the cached entry without
+            reading the file as long as its modification time and size are
+            unchanged; a changed file drops the stale entry
+        @return: an ElementTree instance
+        """
+        if parser is None:
+            parser = tree.XMLParser
+        if hasattr(source, "read"):
+            data = source.read()
+        else:
+            if check_mtime:
+                st = os.stat(source)
+                stat_key = st.st_mtime_ns, st.st_size
+                with self._lock:
+                    known = self._files.get(source)
+                if known is not None:
+                    if known[0] == stat_key:
+                        root = self._lookup(known[1], parser, None)
+                        if root is not None:
+                            return tree.ElementTree(root)
+                    else:
+                        with self._lock:
+                            self._remove((known[1], parser))
+            with open(source, "rb") as f:
+                data = f.read()
+        digest = _digest(data)
+        if check_mtime and not hasattr(source, "read"):
+            with self._lock:
+                self._files[source] = stat_key, digest
+        return tree.ElementTree(self._lookup(digest, parser, (data, )))
+
+    def _lookup(self, digest, parser, data):
+        # returns the tree for the key, parsing the data on a miss; without
+        # data a miss returns None
+        key = digest, parser
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+        if entry is not None:
+            return self._result(entry[0])
+        if data is None:
+            return None
+        p = parser()
+        for chunk in data:
+            p.feed(chunk)
+        root = p.close()
+        size = _tree_size(root)
+        with self._lock:
+            self.misses += 1
+            if size <= self.max_size and key not in self._entries:
+                self._entries[key] = root, size
+                self.size += size
+                while self.size > self.max_size:
+                    _, (_, old_size) = self._entries.popitem(last=False)
+                    self.size -= old_size
+        return self._result(root)
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry[1]
+
+    def _result(self, root):
+        if self.copy:
+            return _copy_tree(root)
+        return root
+
+
+class FragmentCache:
+    """
+    LRU cache of the serialized output of subtrees.
+
+    Pass it as fragments option to Node.write or the writers.  For every
+    selected element the writer looks up the output of the subtree and
+    writes the cached text instead of serializing it again.  The entries
+    are keyed by the key of the subtree, the writer class and options, and
+    the namespace context of the element.  The output is cached before
+    encoding, so it is shared between all output encodings.
+
+    By default the key is the content of the subtree, so an equal subtree
+    in a new tree is found as well, and a changed one is written anew.
+    Computing the key takes a pass over the subtree, which costs about
+    as much as writing a subtree of short strings, but the text is
+    hashed instead of escaped, so it pays off for subtrees with much
+    text.  Subtrees kept between writes, like navigation, sidebars or
+    macro output, are best keyed by identity and a version changed on
+    every modification, for example key=lambda elem: (elem, versions[elem]).
+
+    @ivar hits: number of subtrees taken from the cache
+    @ivar misses: number of subtrees that had to be serialized
+    @ivar size: estimated memory size of the cached output in bytes
+    """
+
+    def __init__(self, max_size=16 * 1024 * 1024, select=None, key=None):
+        """
+        @param max_size: maximum memory size of the cached output in bytes
+        @param select: function returning if the output of an element is
+            cached, None selects all elements
+        @param key: function returning the hashable key of a subtree, None
+            uses the content
+        """
+        self.max_size = max_size
+        self.select = select
+        self.key = key
+        self.hits = self.misses = 0
+        self.size = 0
+        self._entries = OrderedDict() # key -> (text, prefixes, size)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def stats(self):
+        """
+        Returns a dictionary with the hit/miss counters and the cache size.
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+                "size": self.size,
+            }
+
+    def fingerprint(self, elem, memo):
+        """
+        Returns the key of a subtree.  Without key function it is a
+        digest of everything in the subtree the writers depend on.
+
+        @param memo: dict of the values by element id, kept for one write
+            call, so nested subtrees are visited only once
+        """
+        if self.key is not None:
+            return self.key(elem)
+        return _fingerprint(elem, memo)
+
+    def get(self, key):
+        """
+        Returns the (text, prefixes) entry for a key or None.  The prefixes
+        are the namespace prefixes fixed while writing the subtree.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return entry[0], entry[1]
+
+    def put(self, key, text, prefixes):
+        size = sys.getsizeof(text) + 200
+        with self._lock:
+            if size > self.max_size or key in self._entries:
+                return
+            self._entries[key] = text, prefixes, size
+            self.size += size
+            while self.size > self.max_size:
+                _, (_, _, old_size) = self._entries.popitem(last=False)
+                self.size -= old_size
+
+
+def _digest(data):
+    if isinstance(data, str):
+        h = hashlib.blake2b(b"u", digest_size=20)
+        h.update(data.encode("utf-8", "surrogatepass"))
+    else:
+        h = hashlib.blake2b(b"b", digest_size=20)
+        h.update(data)
+    return h.digest()
+
+
+def _fingerprint(elem, memo):
+    # a digest of the content of the subtree, built bottom up from the
+    # digests of the child elements.  The key of every element costs a
+    # pass over its own strings only, and hashing the key, a bytes
+    # object, costs the same at any depth.
+    key = memo.get(id(elem))
+    if key is not None:
+        return key
+    Element = tree.Element
+    QName = tree.QName
+    blake2b = hashlib.blake2b
+    stack = [] # (children, h, node) of the open parents
+    children = iter((elem, ))
+    h = blake2b(digest_size=16)
+    node = None
+    while True:
+        for child in children:
+            if isinstance(child, Element):
+                key = memo.get(id(child))
+                if key is None:
+                    stack.append((children, h, node))
+                    children, h, node = iter(child), blake2b(digest_size=16), child
+                    break
+                h.update(b"e")
+                h.update(key)
+                continue
+            if child.__class__ is str:
+                data = b"s" + child.encode("utf-8", "surrogatepass")
+            elif isinstance(child, tree.Comment):
+                data = b"c" + repr(child.text).encode("utf-8", "surrogatepass")
+            elif isinstance(child, tree.ProcessingInstruction):
+                data = b"p" + repr((child.target, child.text)).encode("utf-8", "surrogatepass")
+            else:
+                data = b"s" + str(child).encode("utf-8", "surrogatepass")
+            # the length keeps neighbouring strings apart
+            h.update(b"%d:" % len(data))
+            h.update(data)
+        else:
+            if node is None:
+                return memo[id(elem)]
+            attrib = node.attrib
+            if not attrib:
+                attrib = ()
+            elif QName in set(map(type, attrib.values())):
+                # QName values are written with prefix, but equal to str
+                attrib = tuple((k, (v.__class__ is QName, v)) for k, v in attrib.items())
+            else:
+                attrib = tuple(attrib.items())
+            head = repr((node.tag, attrib)).encode("utf-8", "surrogatepass")
+            h.update(b"h%d:" % len(head))
+            h.update(head)
+            key = memo[id(node)] = h.digest()
+            children, h, node = stack.pop()
+            h.update(b"e")
+            h.update(key)
+
+
+def _tree_size(root):
+    # estimate the memory used by a tree; tags and attribute names are
+    # shared through the parser's name cache and not counted
+    getsizeof = sys.getsizeof
+    if not isinstance(root, tree.Element):
+        return getsizeof(root)
+    size = 0
+    work = [root]
+    while work:
+        elem = work.pop()
+        size += getsizeof(elem) + getsizeof(elem.__dict__) + getsizeof(elem.attrib) + getsizeof(elem._children)
+        for value in elem.attrib.values():
+            size += getsizeof(value)
+        for child in elem:
+            if isinstance(child, tree.Element):
+                work.append(child)
+            else:
+                size += getsizeof(child)
+    return size
+
+
+def _copy_element(elem):
+    cls = elem.__class__
+    new = cls.__new__(cls)
+    new.__dict__.update(elem.__dict__)
+    new.attrib = elem.attrib.copy()
+    new._children = []
+    return new
+
+
+def _copy_tree(root):
+    # copy the element structure, strings are immutable and shared
+    if not isinstance(root, tree.Element):
+        return copy.copy(root)
+    new_root = _copy_element(root)
+    work = [(root, new_root)]
+    while work:
+        elem, new = work.pop()
+        append = new._children.append
+        for child in elem:
+            if isinstance(child, tree.Element):
+                new_child = _copy_element(child)
+                work.append((child, new_child))
+                append(new_child)
+            elif isinstance(child, str):
+                append(child)
+            else:
+                append(copy.copy(child))
+    return new_root
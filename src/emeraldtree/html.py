@@ -55,6 +55,10 @@ from . import tree
 #     are found, the parser defaults to ISO-8859-1.  Note that if your
 #     document uses a non-ASCII compatible encoding, you must decode
 #     the document before parsing.
+# @keyparam limits Optional tree.ParseLimits instance.  Entity references
+#     are not counted, HTML has no user defined entities.
+# @keyparam bulk Optional tree.BulkBuild instance, or True to use a new
+#     one, suspending the garbage collector while parsing.
 #
 # @see elementtree.ElementTree
 
@@ -64,20 +68,43 @@ class HTMLParser(HTMLParserBase):
 
     namespace = "http://www.w3.org/1999/xhtml"
 
-    def __init__(self, encoding=None, builder=None):
+    def __init__(self, encoding=None, builder=None, limits=None, bulk=None):
         HTMLParserBase.__init__(self)
         self.__stack = []
         self.__builder = builder or tree.TreeBuilder()
+        self.__guard = limits.guard() if limits is not None else None
+        self.bulk = tree._bulk_build(bulk)
         self.encoding = encoding or "iso-8859-1"
 
+    ##
+    # Feeds data to the parser.
+
+    def feed(self, data):
+        if self.bulk is not None:
+            self.bulk.start()
+        try:
+            HTMLParserBase.feed(self, data)
+        except BaseException:
+            if self.bulk is not None:
+                self.bulk.stop(success=False)
+            raise
+
     ##
     # Flushes parser buffers, and return the root element.
     #
     # @return An Element instance.
 
     def close(self):
-        HTMLParserBase.close(self)
-        return self.__builder.close()
+        try:
+            HTMLParserBase.close(self)
+            root = self.__builder.close()
+        except BaseException:
+            if self.bulk is not None:
+                self.bulk.stop(success=False)
+            raise
+        if self.bulk is not None:
+            self.bulk.stop()
+        return root
 
     ##
     # (Internal) Handles start tags.
@@ -101,6 +128,8 @@ class HTMLParser(HTMLParserBase):
         if tag.name in self.AUTOCLOSE:
             if self.__stack and self.__stack[-1] == tag:
                 self.handle_endtag(tag)
+        if self.__guard is not None:
+            self.__guard.start(len(self.__stack) + 1, len(attrs))
         self.__stack.append(tag)
         attrib = {}
         if attrs:
@@ -165,6 +194,8 @@ class HTMLParser(HTMLParserBase):
         if isinstance(data, bytes):
             # convert to unicode, but only if necessary
             data = data.decode(self.encoding, "ignore")
+        if self.__guard is not None:
+            self.__guard.data(len(data))
         self.__builder.data(data)
 
     ##
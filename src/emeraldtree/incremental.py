@@ -0,0 +1,213 @@
+#
+# The ElementTree toolkit is
+#
+# Copyright (c) 1999-2007 by Fredrik Lundh
+#               2008-2010 Bastian Blank <bblank@thinkmo.de>
+#
+# By obtaining, using, and/or copying this software and/or its
+# associated documentation, you agree that you have read, understood,
+# and will comply with the following terms and conditions:
+#
+# Permission to use, copy, modify, and distribute this software and
+# its associated documentation for any purpose and without fee is
+# hereby granted, provided that the above copyright notice appears in
+# all copies, and that both that copyright notice and this permission
+# notice appear in supporting documentation, and that the name of
+# Secret Labs AB or the author not be used in advertising or publicity
+# pertaining to distribution of the software without specific, written
+# prior permission.
+#
+# SECRET LABS AB AND THE AUTHOR DISCLAIMS ALL WARRANTIES WITH REGARD
+# TO THIS SOFTWARE, INCLUDING ALL IMPLIED WARRANTIES OF MERCHANT-
+# ABILITY AND FITNESS.  IN NO EVENT SHALL SECRET LABS AB OR THE AUTHOR
+# BE LIABLE FOR ANY SPECIAL, INDIRECT OR CONSEQUENTIAL DAMAGES OR ANY
+# DAMAGES WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS,
+# WHETHER IN AN ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS
+# ACTION, ARISING OUT OF OR IN CONNECTION WITH THE USE OR PERFORMANCE
+# OF THIS SOFTWARE.
+# --------------------------------------------------------------------
+
+##
+# Incremental re-parsing of edited XML documents.
+##
+
+from . import _markup, tree
+
+
+class IncrementalDocument:
+    """
+    Parsed XML document, which can be updated with text edits.
+
+    The source offsets of all elements are recorded while parsing.  An
+    edit re-parses only the smallest element enclosing the changed text
+    and replaces it in the existing tree; all other elements are kept.
+    If the changed text does not parse as a single element, because the
+    edit crosses element boundaries, the next enclosing element is tried,
+    up to a full parse of the document.
+
+    @ivar text: the current source text
+    @ivar root: the root element
+    """
+
+    def __init__(self, text):
+        self.text = text
+        self._data = text.encode("utf-8")
+        result = _parse(self._data, b"")
+        self.root, self._spans, self._parents, self._contexts, self._entities = result
+
+    def span(self, elem):
+        """
+        Returns the (start, end) character offsets of an element in text.
+        """
+        start, end = self._spans[elem]
+        return len(self._data[:start].decode("utf-8")), len(self._data[:end].decode("utf-8"))
+
+    def edit(self, start, end, text):
+        """
+        Replaces text[start:end] with new text and updates the tree.
+
+        @param start: start character offset of the replaced text
+        @param end: end character offset of the replaced text
+        @param text: replacement text
+        @return: the re-parsed element, which replaced the previous one in
+            the tree, or the new root element after a full parse
+        @raise tree.ParseError: the new text is not well-formed; the
+            document is not modified
+        """
+        new_text = self.text[:start] + text + self.text[end:]
+        byte_start = len(self.text[:start].encode("utf-8"))
+        byte_end = byte_start + len(self.text[start:end].encode("utf-8"))
+        replacement = text.encode("utf-8")
+        delta = len(replacement) - (byte_end - byte_start)
+        data = self._data[:byte_start] + replacement + self._data[byte_end:]
+
+        elem = self._enclosing(byte_start, byte_end)
+        while elem is not None and elem is not self.root:
+            elem_start, elem_end = self._spans[elem]
+            fragment = data[elem_start:elem_end + delta]
+            head, tail = _markup.wrapper(self._entities, self._contexts[elem])
+            try:
+                result = _parse(head + fragment + tail, head, elem_start)
+            except tree.ParseError:
+                result = None
+            if result is not None:
+                wrapper = result[0]
+                if len(wrapper) == 1 and isinstance(wrapper[0], tree.Element):
+                    self._splice(elem, wrapper[0], result, delta)
+                    self.text, self._data = new_text, data
+                    return wrapper[0]
+            # the edit changed the structure around this element
+            elem = self._parents[elem]
+
+        result = _parse(data, b"")
+        self.root, self._spans, self._parents, self._contexts, self._entities = result
+        self.text, self._data = new_text, data
+        return self.root
+
+    def _enclosing(self, start, end):
+        # the deepest element containing the byte range, with its start
+        # and end tag outside of it
+        elem = None
+        children = [self.root]
+        while children:
+            for child in children:
+                child_start, child_end = self._spans[child]
+                if child_start < start and end < child_end:
+                    elem = child
+                    children = list(child.iter_elements())
+                    break
+            else:
+                break
+        return elem
+
+    def _splice(self, old, new, result, delta):
+        _, spans, parents, contexts, _ = result
+        old_start, old_end = self._spans[old]
+        parent = self._parents[old]
+        for i, child in enumerate(parent):
+            if child is old:
+                parent[i] = new
+                break
+
+        for elem in old.iter_elements_tree():
+            del self._spans[elem], self._parents[elem], self._contexts[elem]
+        for elem, (start, end) in self._spans.items():
+            if start >= old_end:
+                self._spans[elem] = start + delta, end + delta
+            elif end >= old_end:
+                # ancestors of the replaced element
+                self._spans[elem] = start, end + delta
+
+        wrapper = result[0]
+        del spans[wrapper], parents[wrapper], contexts[wrapper]
+        parents[new] = parent
+        self._spans.update(spans)
+        self._parents.update(parents)
+        self._contexts.update(contexts)
+
+
+def _parse(data, head, base=0):
+    # parses data, recording the byte range of all elements relative to
+    # the part after head, moved by base
+    builder = tree.TreeBuilder()
+    parser = tree.XMLParser(target=builder, encoding="utf-8")
+    expat = parser.parser
+    offset = base - len(head)
+    spans = {}
+    parents = {}
+    contexts = {}
+    entities = []
+    namespaces = [()]
+    stack = [] # [start, has content, element]
+
+    element_start = expat.StartElementHandler
+    element_end = expat.EndElementHandler
+    character_data = expat.CharacterDataHandler
+
+    def start(tag, attrib_in):
+        pos = expat.CurrentByteIndex
+        if stack:
+            stack[-1][1] = True
+        element_start(tag, attrib_in)
+        elem = builder._elem[-1]
+        parents[elem] = stack[-1][2] if stack else None
+        contexts[elem] = namespaces[-1]
+        stack.append([pos, False, elem])
+
+    def end(tag):
+        pos = expat.CurrentByteIndex
+        elem_start, content, elem = stack.pop()
+        element_end(tag)
+        end = None
+        if not content:
+            end = _markup.tag_end(data, elem_start)
+            if data[end - 2:end] != b"/>":
+                end = None
+        if end is None:
+            end = data.index(b">", pos) + 1
+        spans[elem] = elem_start + offset, end + offset
+
+    def chardata(text):
+        if stack:
+            stack[-1][1] = True
+        character_data(text)
+
+    def start_ns(prefix, uri):
+        namespaces.append(_markup.bind(namespaces[-1], prefix or "", uri))
+
+    def end_ns(prefix):
+        namespaces.pop()
+
+    def entity_decl(name, is_parameter, value, base, system_id, public_id, notation):
+        if not is_parameter and value is not None:
+            entities.append((name, value))
+
+    expat.StartElementHandler = start
+    expat.EndElementHandler = end
+    expat.CharacterDataHandler = chardata
+    expat.StartNamespaceDeclHandler = start_ns
+    expat.EndNamespaceDeclHandler = end_ns
+    expat.EntityDeclHandler = entity_decl
+    parser.feed(data)
+    root = parser.close()
+    return root, spans, parents, contexts, entities
@@ -0,0 +1,224 @@
+#
+# The ElementTree toolkit is
+#
+# Copyright (c) 1999-2007 by Fredrik Lundh
+#               2008-2010 Bastian Blank <bblank@thinkmo.de>
+#
+# By obtaining, using, and/or copying this software and/or its
+# associated documentation, you agree that you have read, understood,
+# and will comply with the following terms and conditions:
+#
+# Permission to use, copy, modify, and distribute this software and
+# its associated documentation for any purpose and without fee is
+# hereby granted, provided that the above copyright notice appears in
+# all copies, and that both that copyright notice and this permission
+# notice appear in supporting documentation, and that the name of
+# Secret Labs AB or the author not be used in advertising or publicity
+# pertaining to distribution of the software without specific, written
+# prior permission.
+#
+# SECRET LABS AB AND THE AUTHOR DISCLAIMS ALL WARRANTIES WITH REGARD
+# TO THIS SOFTWARE, INCLUDING ALL IMPLIED WARRANTIES OF MERCHANT-
+# ABILITY AND FITNESS.  IN NO EVENT SHALL SECRET LABS AB OR THE AUTHOR
+# BE LIABLE FOR ANY SPECIAL, INDIRECT OR CONSEQUENTIAL DAMAGES OR ANY
+# DAMAGES WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS,
+# WHETHER IN AN ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS
+# ACTION, ARISING OUT OF OR IN CONNECTION WITH THE USE OR PERFORMANCE
+# OF THIS SOFTWARE.
+# --------------------------------------------------------------------
+
+##
+# Lazy parsing of large XML documents.  A first pass over the document
+# builds the elements down to a given depth and records the byte range
+# of the elements at that depth.  Their children are parsed only the
+# first time they are accessed.
+##
+
+from xml.parsers import expat
+
+from . import _markup, tree
+
+
+class LazyElement(tree.Element):
+    """
+    Element whose children are parsed from the source document on first
+    access.  Apart from that, it behaves like a normal element.
+    """
+
+    _pending = None # (source, start, end, namespaces) until parsed
+
+    @property
+    def _children(self):
+        if self._pending is not None:
+            self._materialize()
+        return self._loaded
+
+    @_children.setter
+    def _children(self, children):
+        self._pending = None
+        self._loaded = children
+
+    @property
+    def materialized(self):
+        """
+        True if the children have been parsed.
+        """
+        return self._pending is None
+
+    def _materialize(self):
+        source, start, end, namespaces = self._pending
+        head, tail = _markup.wrapper(source.entities, namespaces)
+        parser = tree.XMLParser(encoding=source.encoding)
+        parser.feed(head)
+        parser.feed(source.data[start:end])
+        parser.feed(tail)
+        elem = parser.close()[0]
+        self._children = elem._children
+
+
+class _Source:
+    # the document a lazy element is parsed from
+
+    def __init__(self, data, encoding):
+        self.data = data
+        self.encoding = encoding
+        self.entities = [] # (name, value) of internal entities
+
+
+def fromstring(text, depth=1):
+    """
+    Parses an XML document lazily.
+
+    Elements up to the given depth are built immediately, the root having
+    depth 0.  The elements at that depth are LazyElement instances and
+    parse their children on first access.  Entities declared in the
+    document type are available to the lazily parsed parts as well.
+
+    @param text: str or bytes containing the document
+    @param depth: depth of the lazy elements
+    @return: the root element
+    """
+    encoding = None
+    if isinstance(text, str):
+        text = text.encode("utf-8")
+        encoding = "utf-8"
+    elif text[:2] in (b"\xff\xfe", b"\xfe\xff"):
+        # byte offsets are used with ascii compatible encodings only
+        text = text.decode("utf-16").encode("utf-8")
+        encoding = "utf-8"
+
+    parser = expat.ParserCreate(encoding, "}")
+    parser.buffer_text = 1
+    parser.ordered_attributes = 1
+    parser.specified_attributes = 1
+    source = _Source(text, encoding)
+
+    names = {}
+    builder = tree.TreeBuilder()
+    namespaces = [()] # in-scope namespace declarations
+    lazy = [] # start offset of the open lazy element
+    level = [0] # depth of the next element, the root has depth 0
+    content = [False] # if the current lazy element has content
+
+    def fixname(key):
+        name = names.get(key)
+        if name is None:
+            if "}" in key:
+                uri, local = key.split("}", 1)
+                name = tree.QName(local, uri)
+            else:
+                name = tree.QName(key)
+            names[key] = name
+        return name
+
+    def xml_decl(version, encoding, standalone):
+        if source.encoding is None:
+            source.encoding = encoding
+
+    def entity_decl(name, is_parameter, value, base, system_id, public_id, notation):
+        if not is_parameter and value is not None:
+            source.entities.append((name, value))
+
+    def start_ns(prefix, uri):
+        namespaces.append(_markup.bind(namespaces[-1], prefix or "", uri))
+
+    def end_ns(prefix):
+        namespaces.pop()
+
+    def start(tag, attrib_in):
+        current = level[0]
+        level[0] = current + 1
+        if current > depth:
+            content[0] = True
+            return
+        attrib = {}
+        for i in range(0, len(attrib_in), 2):
+            attrib[fixname(attrib_in[i])] = attrib_in[i + 1]
+        tag = fixname(tag)
+        if current == depth:
+            elem = LazyElement(tag, attrib)
+            builder._flush()
+            if builder._elem:
+                builder._elem[-1].append(elem)
+            builder._elem.append(elem)
+            builder._last = elem
+            lazy.append(parser.CurrentByteIndex)
+            content[0] = False
+        else:
+            builder.start(tag, attrib)
+
+    def end(tag):
+        level[0] -= 1
+        current = level[0]
+        if current > depth:
+            return
+        if current == depth:
+            elem = builder._elem.pop()
+            builder._last = elem
+            start_pos = lazy.pop()
+            # without content there is nothing to parse later
+            if content[0]:
+                end_pos = text.index(b">", parser.CurrentByteIndex) + 1
+                elem._pending = source, start_pos, end_pos, namespaces[-1]
+        else:
+            builder.end(fixname(tag))
+
+    def data(data):
+        current = level[0] - 1
+        if current < depth:
+            builder.data(data)
+        elif current == depth:
+            content[0] = True
+
+    parser.XmlDeclHandler = xml_decl
+    parser.EntityDeclHandler = entity_decl
+    parser.StartNamespaceDeclHandler = start_ns
+    parser.EndNamespaceDeclHandler = end_ns
+    parser.StartElementHandler = start
+    parser.EndElementHandler = end
+    parser.CharacterDataHandler = data
+    try:
+        parser.Parse(text, 1)
+    except expat.error as v:
+        err = tree.ParseError(v)
+        err.code = v.code
+        err.position = v.lineno, v.offset
+        raise err
+    return builder.close()
+
+XML = fromstring
+
+
+def parse(source, depth=1):
+    """
+    Parses an XML document from a file lazily, see fromstring.
+
+    @param source: file name or file object
+    @return: an ElementTree instance
+    """
+    if not hasattr(source, "read"):
+        with open(source, "rb") as f:
+            data = f.read()
+    else:
+        data = source.read()
+    return tree.ElementTree(fromstring(data, depth))
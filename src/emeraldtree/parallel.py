@@ -0,0 +1,449 @@
+#
+# The ElementTree toolkit is
+#
+# Copyright (c) 1999-2007 by Fredrik Lundh
+#               2008-2010 Bastian Blank <bblank@thinkmo.de>
+#
+# By obtaining, using, and/or copying this software and/or its
+# associated documentation, you agree that you have read, understood,
+# and will comply with the following terms and conditions:
+#
+# Permission to use, copy, modify, and distribute this software and
+# its associated documentation for any purpose and without fee is
+# hereby granted, provided that the above copyright notice appears in
+# all copies, and that both that copyright notice and this permission
+# notice appear in supporting documentation, and that the name of
+# Secret Labs AB or the author not be used in advertising or publicity
+# pertaining to distribution of the software without specific, written
+# prior permission.
+#
+# SECRET LABS AB AND THE AUTHOR DISCLAIMS ALL WARRANTIES WITH REGARD
+# TO THIS SOFTWARE, INCLUDING ALL IMPLIED WARRANTIES OF MERCHANT-
+# ABILITY AND FITNESS.  IN NO EVENT SHALL SECRET LABS AB OR THE AUTHOR
+# BE LIABLE FOR ANY SPECIAL, INDIRECT OR CONSEQUENTIAL DAMAGES OR ANY
+# DAMAGES WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS,
+# WHETHER IN AN ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS
+# ACTION, ARISING OUT OF OR IN CONNECTION WITH THE USE OR PERFORMANCE
+# OF THIS SOFTWARE.
+# --------------------------------------------------------------------
+
+##
+# Parallel parsing with a process pool.
+##
+
+import multiprocessing
+import re
+from collections import deque
+from xml.parsers import expat
+
+from . import _markup, tree
+
+# marks the end of an element in the packed form
+_END = -1
+
+
+class _RootFound(Exception):
+    # stops expat at the start tag of the root element
+    pass
+
+
+def parse_many(documents, parser=None, processes=None, chunksize=16, ordered=True,
+               element_factory=None):
+    """
+    Parses many documents in a pool of worker processes.
+
+    The trees are sent back from the workers in a flat packed form, which
+    is much cheaper to transfer than pickled elements, and are rebuilt in
+    the calling process.  A document that fails to parse is reported with
+    its error, the other documents are not affected.
+
+    @param documents: iterable of str or bytes documents
+    @param parser: callable returning a new parser instance, defaults to
+        tree.XMLParser, for example html.HTMLParser.  It has to be
+        picklable, like a module level class or a functools.partial of it.
+    @param processes: number of worker processes, defaults to the number
+        of CPUs; with 1 the documents are parsed in this process
+    @param chunksize: number of documents sent to a worker at once
+    @param ordered: yield results in input order; otherwise in completion
+        order, which keeps all workers busy with documents of uneven size
+    @param element_factory: optional element factory used to rebuild the
+        trees, see tree.TreeBuilder
+    @return: iterator of (index, root, error) tuples, where index is the
+        position of the document in the input and either root is the root
+        element or error is a tree.ParseError
+    """
+    if parser is None:
+        parser = tree.XMLParser
+    unpack = _Unpacker(element_factory)
+    if processes == 1:
+        _init_worker(parser)
+        for index, document in enumerate(documents):
+            yield unpack.result(_parse_one((index, document)))
+        return
+
+    with multiprocessing.Pool(processes, _init_worker, (parser, )) as pool:
+        if ordered:
+            results = pool.imap(_parse_one, enumerate(documents), chunksize)
+        else:
+            results = pool.imap_unordered(_parse_one, enumerate(documents), chunksize)
+        for result in results:
+            yield unpack.result(result)
+
+
+def iterrecords(source, tag=None, parser=None, processes=None, batch_size=256,
+                element_factory=None):
+    """
+    Parses a document consisting of many records in parallel.
+
+    The document is a root element with many independent child elements,
+    the records.  The records are found by a scan of the source for their
+    start and end tags, and batches of records are parsed in a pool of
+    worker processes.  Each batch is parsed with the prolog and the start
+    tag of the root element, so namespace declarations and entities of the
+    document are available.
+
+    Records are found textually: other content between them is skipped,
+    and their tag must not appear within comments or CDATA sections.  The
+    document has to use an ASCII compatible encoding.
+
+    @param source: file name or binary file object
+    @param tag: tag of the records as written in the source, including a
+        prefix, defaults to the tag of the first child of the root
+    @param parser: parser factory, see parse_many
+    @param processes: number of worker processes, see parse_many
+    @param batch_size: number of records parsed by a worker at once
+    @param element_factory: optional element factory, see parse_many
+    @return: iterator of the record elements, in document order
+    @raise tree.ParseError: a batch of records is not well-formed
+    """
+    if parser is None:
+        parser = tree.XMLParser
+    close_source = False
+    if not hasattr(source, "read"):
+        source = open(source, "rb")
+        close_source = True
+    try:
+        reader = _RecordReader(source, tag)
+        head, tail = reader.head()
+        unpack = _Unpacker(element_factory)
+        batches = _batches(reader, batch_size)
+
+        if processes == 1:
+            _init_worker(parser)
+            for batch in batches:
+                for packed in _parse_records(head, batch, tail):
+                    yield unpack.unpack(*packed)
+            return
+
+        with multiprocessing.Pool(processes, _init_worker, (parser, )) as pool:
+            # keep all workers busy, but do not read the whole source ahead
+            window = 2 * (processes or multiprocessing.cpu_count())
+            pending = deque()
+            for batch in batches:
+                pending.append(pool.apply_async(_parse_records, (head, batch, tail)))
+                if len(pending) >= window:
+                    for packed in pending.popleft().get():
+                        yield unpack.unpack(*packed)
+            while pending:
+                for packed in pending.popleft().get():
+                    yield unpack.unpack(*packed)
+    finally:
+        if close_source:
+            source.close()
+
+
+def _batches(reader, batch_size):
+    batch = []
+    for record in reader:
+        batch.append(record)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class _RecordReader:
+    # scans a source for the records below the root element
+
+    read_size = 1024 * 1024
+
+    def __init__(self, source, tag):
+        self._source = source
+        self._tag = tag.encode("utf-8") if tag is not None else None
+        self._buffer = b""
+        self._pos = 0
+        self._eof = False
+
+    def _read(self):
+        # appends data to the buffer, drops what was consumed
+        if self._eof:
+            return False
+        data = self._source.read(self.read_size)
+        if not data:
+            self._eof = True
+            return False
+        self._buffer = self._buffer[self._pos:] + data
+        self._pos = 0
+        return True
+
+    def head(self):
+        """
+        Returns the document up to the start tag of the root element, and
+        the matching end tag.
+        """
+        found = []
+
+        def start(tag, attrib):
+            found.append(parser.CurrentByteIndex)
+            raise _RootFound
+
+        parser = expat.ParserCreate()
+        parser.StartElementHandler = start
+        offset = 0
+        while not found:
+            if not self._read():
+                raise tree.ParseError("no root element found")
+            try:
+                parser.Parse(self._buffer[offset:], 0)
+            except _RootFound:
+                pass
+            except expat.error as v:
+                err = tree.ParseError(v)
+                err.code = v.code
+                err.position = v.lineno, v.offset
+                raise err
+            offset = len(self._buffer)
+        start = found[0]
+        end = self._tag_end(start)
+        buffer = self._buffer
+        name = re.compile(rb"<([^\s/>]+)").match(buffer, start).group(1)
+        self._pos = end
+        if buffer[end - 2:end] == b"/>":
+            # nothing to read
+            self._eof = True
+            self._pos = len(buffer)
+            return buffer[:end - 2] + b">", b"</" + name + b">"
+        return buffer[:end], b"</" + name + b">"
+
+    def _tag_end(self, start):
+        while True:
+            try:
+                return _markup.tag_end(self._buffer, start)
+            except ValueError:
+                if not self._read():
+                    raise tree.ParseError("unclosed token")
+
+    def __iter__(self):
+        if self._tag is None:
+            self._tag = self._first_tag()
+            if self._tag is None:
+                return
+        # complete start or end tags of records, skipping quoted values
+        tag_re = re.compile(rb"<(/?)" + re.escape(self._tag) +
+                            rb"(?=[\s/>])((?:[^>\"']|\"[^\"]*\"|'[^']*')*)>")
+        while True:
+            record = self._next_record(tag_re)
+            if record is None:
+                return
+            yield record
+
+    def _first_tag(self):
+        # the name of the first start tag, skipping markup without content
+        names = re.compile(rb"<!--.*?-->|<\?.*?\?>|<!\[CDATA\[.*?\]\]>|<(/?)([^\s/>!?]+)[\s/>]", re.S)
+        while True:
+            match = names.search(self._buffer, self._pos)
+            if match is not None and match.group(2) is not None:
+                if match.group(1):
+                    # end of the root element, no records
+                    return None
+                return match.group(2)
+            # incomplete, or only comments so far
+            if match is not None:
+                self._pos = match.end()
+            elif not self._read():
+                return None
+
+    def _next_record(self, tag_re):
+        # returns the bytes of the next record, None at the end
+        while True:
+            match = tag_re.search(self._buffer, self._pos)
+            if match is not None and not match.group(1):
+                end = self._record_end(tag_re, match.start())
+                if end is not None:
+                    record = self._buffer[match.start():end]
+                    self._pos = end
+                    return record
+            elif match is not None:
+                raise tree.ParseError("unexpected end tag of a record")
+            else:
+                # keep a possibly incomplete tag in the buffer
+                self._pos = max(self._pos, self._buffer.rfind(b"<"))
+            if not self._read():
+                if match is not None:
+                    raise tree.ParseError("unclosed record")
+                return None
+
+    def _record_end(self, tag_re, start):
+        # the end of the record starting at start, None if incomplete
+        depth = 0
+        for match in tag_re.finditer(self._buffer, start):
+            if match.group(1):
+                depth -= 1
+                if not depth:
+                    return match.end()
+            elif not match.group(2).endswith(b"/"):
+                depth += 1
+            elif not depth:
+                return match.end()
+        return None
+
+
+def _parse_records(head, records, tail):
+    p = _parser_factory()
+    p.feed(head)
+    for record in records:
+        p.feed(record)
+    p.feed(tail)
+    root = p.close()
+    return [_pack(child) for child in root.iter_elements()]
+
+
+_parser_factory = None
+
+
+def _init_worker(parser):
+    global _parser_factory
+    _parser_factory = parser
+
+
+def _parse_one(task):
+    index, document = task
+    try:
+        p = _parser_factory()
+        p.feed(document)
+        root = p.close()
+    except Exception as e:
+        return index, None, (type(e).__name__, str(e), getattr(e, "code", None),
+                             getattr(e, "position", None))
+    return index, _pack(root), None
+
+
+def _pack(root):
+    """
+    Converts an element tree to a flat list, see _Unpacker.
+
+    @return: (names, data) tuple
+    """
+    names = {}
+    data = []
+    append = data.append
+
+    def name_index(name):
+        index = names.get(name)
+        if index is None:
+            index = names[name] = len(names)
+        return index
+
+    work = [root]
+    while work:
+        node = work.pop()
+        if node is _END:
+            append(_END)
+        elif isinstance(node, tree.Element):
+            append(name_index(node.tag))
+            attrib = node.attrib
+            append(len(attrib))
+            for key, value in attrib.items():
+                append(name_index(key))
+                append(value)
+            work.append(_END)
+            work.extend(reversed(node._children))
+        elif isinstance(node, tree.Comment):
+            append(("!", node.text))
+        elif isinstance(node, tree.ProcessingInstruction):
+            append(("?", node.target, node.text))
+        else:
+            append(str(node))
+    names = [(name.name, name.uri) if isinstance(name, tree.QName) else (name, False)
+             for name in names]
+    return names, data
+
+
+class _Unpacker:
+    # rebuilds trees from the packed form
+    #
+    # data holds the nodes in document order: elements as the index of
+    # their tag in names, the number of attributes, attribute name index
+    # and value pairs, the children and _END; text as str; comments and
+    # processing instructions as tuples
+
+    def __init__(self, element_factory=None):
+        self._factory = element_factory
+        self._names = {} # shared by all trees
+
+    def result(self, result):
+        index, packed, error = result
+        if error is not None:
+            name, message, code, position = error
+            err = tree.ParseError(message if name == "ParseError" else
+                                  "{}: {}".format(name, message))
+            err.code = code
+            err.position = position
+            return index, None, err
+        return index, self.unpack(*packed), None
+
+    def unpack(self, names, data):
+        # the rebuild in the calling process limits the speedup
+        with tree.BulkBuild():
+            return self._unpack(names, data)
+
+    def _unpack(self, names, data):
+        cache = self._names
+        tags = []
+        for name in names:
+            tag = cache.get(name)
+            if tag is None:
+                local, uri = name
+                tag = cache[name] = local if uri is False else tree.QName(local, uri)
+            tags.append(tag)
+
+        factory = self._factory
+        new = tree.Element.__new__
+        Element = tree.Element
+        stack = []
+        root = None
+        i = 0
+        n = len(data)
+        while i < n:
+            item = data[i]
+            i += 1
+            if item.__class__ is int:
+                if item == _END:
+                    root = stack.pop()
+                    continue
+                count = data[i]
+                i += 1
+                attrib = {}
+                for j in range(i, i + 2 * count, 2):
+                    attrib[tags[data[j]]] = data[j + 1]
+                i += 2 * count
+                if factory is None:
+                    elem = new(Element)
+                    elem.tag = tags[item]
+                    elem.attrib = attrib
+                    elem._children = []
+                else:
+                    elem = factory(tags[item], attrib)
+                if stack:
+                    stack[-1]._children.append(elem)
+                stack.append(elem)
+            elif item.__class__ is tuple:
+                if item[0] == "!":
+                    node = tree.Comment(item[1])
+                else:
+                    node = tree.PI(item[1], item[2])
+                stack[-1]._children.append(node)
+            else:
+                stack[-1]._children.append(item)
+        return root
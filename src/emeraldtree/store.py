@@ -0,0 +1,416 @@
+#
+# The ElementTree toolkit is
+#
+# Copyright (c) 1999-2007 by Fredrik Lundh
+#               2008-2010 Bastian Blank <bblank@thinkmo.de>
+#
+# By obtaining, using, and/or copying this software and/or its
+# associated documentation, you agree that you have read, understood,
+# and will comply with the following terms and conditions:
+#
+# Permission to use, copy, modify, and distribute this software and
+# its associated documentation for any purpose and without fee is
+# hereby granted, provided that the above copyright notice appears in
+# all copies, and that both that copyright notice and this permission
+# notice appear in supporting documentation, and that the name of
+# Secret Labs AB or the author not be used in advertising or publicity
+# pertaining to distribution of the software without specific, written
+# prior permission.
+#
+# SECRET LABS AB AND THE AUTHOR DISCLAIMS ALL WARRANTIES WITH REGARD
+# TO THIS SOFTWARE, INCLUDING ALL IMPLIED WARRANTIES OF MERCHANT-
+# ABILITY AND FITNESS.  IN NO EVENT SHALL SECRET LABS AB OR THE AUTHOR
+# BE LIABLE FOR ANY SPECIAL, INDIRECT OR CONSEQUENTIAL DAMAGES OR ANY
+# DAMAGES WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS,
+# WHETHER IN AN ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS
+# ACTION, ARISING OUT OF OR IN CONNECTION WITH THE USE OR PERFORMANCE
+# OF THIS SOFTWARE.
+# --------------------------------------------------------------------
+
+##
+# Disk-backed element trees.  The nodes of the document are stored in an
+# SQLite database, only a bounded number of elements keep their children
+# in memory.
+##
+
+import json
+import sqlite3
+from collections import OrderedDict
+
+from . import tree
+
+# node kinds
+_ELEMENT, _TEXT, _COMMENT, _PI = range(4)
+
+# parent of removed elements, which may still be added somewhere else
+_DETACHED = -1
+
+_schema = """
+CREATE TABLE IF NOT EXISTS nodes (
+    id INTEGER PRIMARY KEY,
+    parent INTEGER,
+    pos INTEGER NOT NULL,
+    kind INTEGER NOT NULL,
+    name TEXT,
+    uri TEXT,
+    attrib TEXT,
+    text TEXT
+);
+CREATE INDEX IF NOT EXISTS nodes_parent ON nodes (parent, pos);
+"""
+
+
+class StoredElement(tree.Element):
+    """
+    Element backed by a row of a StoredTree.
+
+    The children are loaded from the store on first access and dropped
+    again when the element is evicted from the cache of the store, so the
+    same element may be represented by different objects over time.
+    Changes through the element methods are written back by
+    StoredTree.flush; changes of the attrib dictionary itself must be
+    made with set or clear to be noticed.
+    """
+
+    _loaded = None
+
+    @property
+    def _children(self):
+        if self._loaded is None:
+            self._store._load(self)
+        else:
+            self._store._touch(self)
+        return self._loaded
+
+    @_children.setter
+    def _children(self, children):
+        self._loaded = children
+        self._store._modified(self, True)
+
+    @property
+    def materialized(self):
+        """
+        True if the children are loaded.
+        """
+        return self._loaded is not None
+
+    def __setitem__(self, index, element):
+        super().__setitem__(index, element)
+        self._store._modified(self, True)
+
+    def __delitem__(self, index):
+        super().__delitem__(index)
+        self._store._modified(self, True)
+
+    def append(self, element):
+        super().append(element)
+        self._store._modified(self, True)
+
+    def extend(self, elements):
+        super().extend(elements)
+        self._store._modified(self, True)
+
+    def insert(self, index, element):
+        super().insert(index, element)
+        self._store._modified(self, True)
+
+    def remove(self, element):
+        super().remove(element)
+        self._store._modified(self, True)
+
+    def clear(self):
+        super().clear()
+        self._store._modified(self, False)
+
+    def set(self, key, value):
+        super().set(key, value)
+        self._store._modified(self, False)
+
+
+class StoredTree(tree.ElementTree):
+    """
+    Element tree stored in an SQLite database.
+
+    Use parse to import a document, which is streamed into the database
+    without building the tree in memory.  An existing database is opened
+    with the document it contains.  At most cache_size elements keep
+    their children loaded, the least recently used ones are dropped
+    first.  Modified elements are written back when elements are
+    dropped, or on flush.
+
+    @param path: file name of the database, ":memory:" for a temporary one
+    @param cache_size: number of elements with loaded children
+    @ivar loads: number of children lists loaded from the database
+    @ivar evictions: number of children lists dropped from memory
+    """
+
+    def __init__(self, path, cache_size=1024):
+        self._db = sqlite3.connect(path)
+        self._db.executescript(_schema)
+        self.cache_size = cache_size
+        self.loads = self.evictions = 0
+        self._cache = OrderedDict() # element -> None, in LRU order
+        self._dirty = {} # element -> children modified
+        row = self._db.execute(
+            "SELECT id, name, uri, attrib FROM nodes WHERE parent IS NULL").fetchone()
+        root = None
+        if row is not None:
+            root = self._element(*row)
+        tree.ElementTree.__init__(self, root)
+
+    def close(self):
+        """
+        Writes back all changes, deletes removed elements and closes the
+        database.
+        """
+        self.flush()
+        with self._db:
+            self._db.execute(
+                "WITH RECURSIVE sub(id) AS (SELECT id FROM nodes WHERE parent = ? UNION ALL "
+                "SELECT nodes.id FROM nodes JOIN sub ON nodes.parent = sub.id) "
+                "DELETE FROM nodes WHERE id IN sub", (_DETACHED, ))
+        self._db.close()
+
+    def parse(self, source):
+        """
+        Imports a document, replacing the stored one.
+
+        @param source: file name or file object
+        @return: the root element
+        """
+        close_source = False
+        if not hasattr(source, "read"):
+            source = open(source, "rb")
+            close_source = True
+        try:
+            db = self._db
+            with db:
+                db.execute("DELETE FROM nodes")
+                parser = tree.XMLParser(target=_StoreBuilder(db))
+                while 1:
+                    data = source.read(65536)
+                    if not data:
+                        break
+                    parser.feed(data)
+                root_id = parser.close()
+            self._cache.clear()
+            self._dirty.clear()
+            row = db.execute("SELECT id, name, uri, attrib FROM nodes WHERE id = ?",
+                             (root_id, )).fetchone()
+            self._root = self._element(*row)
+            return self._root
+        finally:
+            if close_source:
+                source.close()
+
+    def flush(self):
+        """
+        Writes back all modified elements.
+        """
+        self._write_back()
+        self._evict()
+
+    def _write_back(self):
+        if not self._dirty:
+            return
+        dirty = self._dirty
+        self._dirty = {}
+        with self._db:
+            # detach all removed elements first, they may have been moved
+            # to another modified element
+            for elem, children in dirty.items():
+                if children:
+                    self._db.execute("UPDATE nodes SET parent = ? WHERE parent = ? AND kind = ?",
+                                     (_DETACHED, elem._id, _ELEMENT))
+            for elem, children in dirty.items():
+                self._write_element(elem)
+                if children:
+                    self._write_children(elem)
+
+    def _element(self, id, name, uri, attrib):
+        elem = StoredElement.__new__(StoredElement)
+        elem.tag = tree.QName(name, uri)
+        elem.attrib = {tree.QName(k, u): v for k, u, v in json.loads(attrib)} if attrib else {}
+        elem._store = self
+        elem._id = id
+        return elem
+
+    def _load(self, elem):
+        children = []
+        if elem._id is not None:
+            rows = self._db.execute(
+                "SELECT id, kind, name, uri, attrib, text FROM nodes WHERE parent = ? ORDER BY pos",
+                (elem._id, ))
+            for id, kind, name, uri, attrib, text in rows:
+                if kind == _ELEMENT:
+                    children.append(self._element(id, name, uri, attrib))
+                elif kind == _TEXT:
+                    children.append(text)
+                elif kind == _COMMENT:
+                    children.append(tree.Comment(text))
+                else:
+                    children.append(tree.PI(name, text))
+        self.loads += 1
+        elem._loaded = children
+        self._cache[elem] = None
+        self._evict()
+
+    def _touch(self, elem):
+        # marks the children of an element as most recently used
+        try:
+            self._cache.move_to_end(elem)
+        except KeyError:
+            pass
+
+    def _evict(self):
+        cache = self._cache
+        if len(cache) <= self.cache_size:
+            return
+        # the children of evicted elements are loaded again from the
+        # database, which has to include all changes by then
+        self._write_back()
+        while len(cache) > self.cache_size:
+            elem, _ = cache.popitem(last=False)
+            elem._loaded = None
+            self.evictions += 1
+
+    def _modified(self, elem, children):
+        if children and elem not in self._cache:
+            self._cache[elem] = None
+        self._dirty[elem] = self._dirty.get(elem, False) or children
+
+    def _write_element(self, elem):
+        name, uri = _split_name(elem.tag)
+        self._db.execute("UPDATE nodes SET name = ?, uri = ?, attrib = ? WHERE id = ?",
+                         (name, uri, _dump_attrib(elem.attrib), elem._id))
+
+    def _write_children(self, elem):
+        db = self._db
+        db.execute("DELETE FROM nodes WHERE parent = ? AND kind != ?", (elem._id, _ELEMENT))
+        children = elem._loaded
+        for pos, child in enumerate(children):
+            if isinstance(child, StoredElement) and child._store is self:
+                db.execute("UPDATE nodes SET parent = ?, pos = ? WHERE id = ?",
+                           (elem._id, pos, child._id))
+            elif isinstance(child, tree.Element):
+                # copy new elements into the store, and use the stored
+                # element from now on
+                id = _insert_tree(db, child, elem._id, pos)
+                children[pos] = self._element(id, *_split_name(child.tag),
+                                              _dump_attrib(child.attrib))
+            else:
+                _insert_node(db, child, elem._id, pos)
+
+
+class _StoreBuilder:
+    # parser target writing the nodes directly to the database
+
+    def __init__(self, db):
+        self._db = db
+        self._stack = [] # [id, next child position]
+        self._data = []
+        self._rows = []
+        self._root = None
+
+    def _flush(self):
+        if self._data:
+            if self._stack:
+                parent = self._stack[-1]
+                self._rows.append((parent[0], parent[1], _TEXT, None, None, None, "".join(self._data)))
+                parent[1] += 1
+            self._data = []
+        if len(self._rows) >= 1000:
+            self._write()
+
+    def _write(self):
+        self._db.executemany(
+            "INSERT INTO nodes (parent, pos, kind, name, uri, attrib, text) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            self._rows)
+        self._rows = []
+
+    def start(self, tag, attrib):
+        self._flush()
+        parent = None
+        pos = 0
+        if self._stack:
+            parent, pos = self._stack[-1]
+            self._stack[-1][1] += 1
+        name, uri = _split_name(tag)
+        # the id is needed for the children
+        self._write()
+        id = self._db.execute(
+            "INSERT INTO nodes (parent, pos, kind, name, uri, attrib) VALUES (?, ?, ?, ?, ?, ?)",
+            (parent, pos, _ELEMENT, name, uri, _dump_attrib(attrib))).lastrowid
+        if self._root is None:
+            self._root = id
+        self._stack.append([id, 0])
+
+    def data(self, data):
+        self._data.append(data)
+
+    def end(self, tag):
+        self._flush()
+        self._stack.pop()
+
+    def close(self):
+        self._flush()
+        self._write()
+        assert self._root is not None, "missing toplevel element"
+        return self._root
+
+
+def _split_name(name):
+    if isinstance(name, tree.QName):
+        return name.name, name.uri
+    return name, None
+
+
+def _dump_attrib(attrib):
+    if not attrib:
+        return None
+    return json.dumps([_split_name(key) + (value, ) for key, value in attrib.items()])
+
+
+def _insert_node(db, node, parent, pos):
+    if isinstance(node, tree.Comment):
+        row = _COMMENT, None, node.text
+    elif isinstance(node, tree.ProcessingInstruction):
+        row = _PI, node.target, node.text
+    else:
+        row = _TEXT, None, str(node)
+    db.execute("INSERT INTO nodes (parent, pos, kind, name, text) VALUES (?, ?, ?, ?, ?)",
+               (parent, pos) + row)
+
+
+def _insert_tree(db, elem, parent, pos):
+    # copies an element and its content into the store, returns its id
+    def insert(elem, parent, pos):
+        name, uri = _split_name(elem.tag)
+        return db.execute(
+            "INSERT INTO nodes (parent, pos, kind, name, uri, attrib) VALUES (?, ?, ?, ?, ?, ?)",
+            (parent, pos, _ELEMENT, name, uri, _dump_attrib(elem.attrib))).lastrowid
+
+    top = insert(elem, parent, pos)
+    work = [(elem, top)]
+    while work:
+        elem, id = work.pop()
+        for pos, child in enumerate(elem):
+            if isinstance(child, tree.Element):
+                work.append((child, insert(child, id, pos)))
+            else:
+                _insert_node(db, child, id, pos)
+    return top
+
+
+def parse(source, path, cache_size=1024):
+    """
+    Imports a document into a new store.
+
+    @param source: file name or file object
+    @param path: file name of the database
+    @param cache_size: see StoredTree
+    @return: a StoredTree instance
+    """
+    stored = StoredTree(path, cache_size)
+    stored.parse(source)
+    return stored
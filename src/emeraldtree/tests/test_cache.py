@@ -0,0 +1,178 @@
+import os
+
+import pytest
+
+from .. import html, tree
+from ..cache import FragmentCache, ParseCache
+
+def test_XML():
+    cache = ParseCache()
+    elem1 = cache.XML('<a x="1">b<c /></a>')
+    elem2 = cache.XML('<a x="1">b<c /></a>')
+    assert cache.hits == 1
+    assert cache.misses == 1
+    assert len(cache) == 1
+    assert elem1 is not elem2
+    assert elem1[1] is not elem2[1]
+    assert elem2.tag == 'a'
+    assert elem2.attrib == {'x': '1'}
+    assert elem2[0] == 'b'
+    assert elem2[1].tag == 'c'
+
+    elem2.set('x', '2')
+    elem2.append('d')
+    elem3 = cache.XML('<a x="1">b<c /></a>')
+    assert elem3.get('x') == '1'
+    assert len(elem3) == 2
+
+@pytest.mark.parametrize('spill', [None, 100])
+def test_XML_chunked_text(spill):
+    # every copy has its own chunks and temporary file
+    def parser():
+        return tree.XMLParser(target=tree.TreeBuilder(chunk_text=10, spill_text=spill))
+    cache = ParseCache()
+    text = 'x' * 200
+    elem1 = cache.XML('<a>%s</a>' % text, parser=parser)
+    assert isinstance(elem1[0], tree.ChunkedText)
+    elem1[0].append('y')
+    elem2 = cache.XML('<a>%s</a>' % text, parser=parser)
+    assert cache.hits == 1
+    assert str(elem2[0]) == text
+    elem2[0].append('z')
+    assert str(elem1[0]) == text + 'y'
+    assert str(cache.XML('<a>%s</a>' % text, parser=parser)[0]) == text
+
+def test_XML_shared():
+    cache = ParseCache(copy=False)
+    elem1 = cache.XML('<a />')
+    elem2 = cache.XML('<a />')
+    assert elem1 is elem2
+
+def test_XML_parser_key():
+    cache = ParseCache()
+    elem1 = cache.XML('<p>a</p>')
+    elem2 = cache.XML('<p>a</p>', parser=html.HTMLParser)
+    assert cache.misses == 2
+    assert elem1.tag == 'p'
+    assert elem2.tag == tree.QName('p', html.HTMLParser.namespace)
+
+def test_max_size():
+    cache = ParseCache(max_size=2000)
+    for i in range(20):
+        cache.XML('<a>%d</a>' % i)
+    stats = cache.stats()
+    assert stats['misses'] == 20
+    assert 0 < stats['entries'] < 20
+    assert stats['size'] <= 2000
+    cache.XML('<a>19</a>')
+    assert cache.hits == 1
+
+def test_parse_mtime(tmp_path):
+    name = str(tmp_path / 'test.xml')
+    with open(name, 'w') as f:
+        f.write('<a>1</a>')
+    cache = ParseCache()
+    assert cache.parse(name, check_mtime=True).getroot()[0] == '1'
+    assert cache.parse(name, check_mtime=True).getroot()[0] == '1'
+    assert cache.hits == 1
+
+    with open(name, 'w') as f:
+        f.write('<a>22</a>')
+    os.utime(name, ns=(0, 0))
+    assert cache.parse(name, check_mtime=True).getroot()[0] == '22'
+    assert cache.misses == 2
+    assert len(cache) == 1
+
+def serialize(elem, **options):
+    out = []
+    elem.write(out.append, **options)
+    return ''.join(out)
+
+def test_FragmentCache():
+    source = '<html><div class="nav"><a href="/x?a&amp;b">x</a><!-- c --></div><p>%s</p></html>'
+    cache = FragmentCache(select=lambda elem: elem.get('class') == 'nav')
+    for method in 'xml', 'html', 'polyglot':
+        for text in 'a', 'b', 'c':
+            elem = tree.XML(source % text)
+            assert serialize(elem, method=method, fragments=cache) == serialize(elem, method=method)
+    assert cache.stats() == {'hits': 6, 'misses': 3, 'entries': 3, 'size': cache.size}
+
+    # a changed subtree is written again
+    elem[0][0].set('href', '/y')
+    assert serialize(elem, fragments=cache) == serialize(elem)
+    assert cache.misses == 4
+
+def test_FragmentCache_namespaces():
+    # the prefixes fixed by a cached subtree stay fixed on a hit
+    elem = tree.XML('<r><a xmlns="u"><b xmlns="v" /></a><c xmlns="v" /><d xmlns="w" /></r>')
+    expected = serialize(elem)
+    assert 'ns2:d' in expected
+    cache = FragmentCache(select=lambda elem: elem.tag.name == 'a')
+    assert serialize(elem, fragments=cache) == expected
+    assert serialize(elem, fragments=cache) == expected
+    assert cache.hits == 1
+    assert serialize(elem, fragments=cache, namespaces={'u': 'p'}) == serialize(elem, namespaces={'u': 'p'})
+    assert cache.misses == 2
+
+def test_FragmentCache_key():
+    nav = tree.XML('<ul><li>1</li></ul>')
+    versions = {nav: 1}
+    cache = FragmentCache(select=lambda elem: elem is nav, key=lambda elem: (elem, versions[elem]))
+    page = tree.Element('body', children=[nav])
+    assert serialize(page, fragments=cache) == '<body><ul><li>1</li></ul></body>'
+    page = tree.Element('body', children=[nav, 'x'])
+    assert serialize(page, fragments=cache) == '<body><ul><li>1</li></ul>x</body>'
+    assert cache.hits == 1
+    nav[0].append('2')
+    versions[nav] = 2
+    assert serialize(page, fragments=cache) == '<body><ul><li>12</li></ul>x</body>'
+
+def test_FragmentCache_size():
+    cache = FragmentCache(max_size=10000)
+    for i in range(20):
+        serialize(tree.Element('a', children=[str(i) * 1000]), fragments=cache)
+    assert cache.size <= 10000
+    assert 0 < len(cache) < 20
+
+def test_FragmentCache_steps():
+    # write_steps, iterwrite and write_async use the cache as well
+    import asyncio
+    source = '<html><div class="nav"><a href="/">x</a></div><p>%d</p></html>'
+    cache = FragmentCache(select=lambda elem: elem.get('class') == 'nav')
+    for i in range(2):
+        elem = tree.XML(source % i)
+        expected = serialize(elem)
+        out = []
+        steps = list(elem.write_steps(out.append, fragments=cache))
+        assert ''.join(out) == expected
+        assert len(steps) > 1
+        assert b''.join(tree.iterwrite(elem, fragments=cache)) == expected.encode('ascii')
+        blocks = []
+
+        async def target(block):
+            blocks.append(block)
+        asyncio.run(elem.write_async(target, encoding='utf-8', fragments=cache))
+        assert b''.join(blocks) == expected.encode('utf-8')
+    assert cache.stats()['misses'] == 1
+    assert cache.stats()['hits'] == 5
+
+def test_FragmentCache_fingerprint():
+    cache = FragmentCache()
+    a = tree.Element('a', children=['ab', 'c', tree.Element('b', x='1')])
+    key = cache.fingerprint(a, {})
+    assert isinstance(key, bytes)
+    assert cache.fingerprint(tree.Element('a', children=['ab', 'c', tree.Element('b', x='1')]), {}) == key
+    assert cache.fingerprint(tree.Element('a', children=['a', 'bc', tree.Element('b', x='1')]), {}) != key
+    assert cache.fingerprint(tree.Element('a', children=['ab', 'c', tree.Element('b', x='2')]), {}) != key
+
+    # every element is keyed in time independent of its depth
+    root = elem = tree.Element('a')
+    for i in range(3000):
+        child = tree.Element('b')
+        elem.append(child)
+        elem = child
+    elem.append('x')
+    expected = serialize(root)
+    assert serialize(root, fragments=cache) == expected
+    assert serialize(root, fragments=cache) == expected
+    assert cache.hits == 1
@@ -1,5 +1,7 @@
 from io import StringIO
 
+import pytest
+
 from .. import html, tree
 
 def serialize(elem, method):
@@ -51,7 +53,11 @@ def test_write():
     x = serialize(elem, 'xml')
     assert '<br><p>' in h
     assert '<br /><p></p>' in p
-    assert '<br /><p />' in x
+    assert '<ns0:br /><ns0:p />' in x
+    # the html writers do not change the namespaces of later xml writers
+    file = StringIO()
+    elem.write(file.write, namespaces={html.HTMLParser.namespace: ''})
+    assert '<br /><p />' in file.getvalue()
 
 def test_read_meta():
     parser = html.HTMLParser()
@@ -60,3 +66,56 @@ def test_read_meta():
     parser.feed('<meta http-equiv="content-type" content="text/html; charset=UTF-8">"')
     assert parser.encoding == 'UTF-8'
     parser.close()
+
+def test_read_skip():
+    script = tree.QName('script', html.HTMLParser.namespace)
+    parser = html.HTMLParser(builder=tree.TreeBuilder(skip=(script, )))
+    parser.feed('<html><body><script>x = 1 < 2</script><p>a</p></body></html>')
+    elem = parser.close()
+    assert serialize(elem, 'html') == '<html xmlns="http://www.w3.org/1999/xhtml"><body><p>a</p></body></html>'
+
+def test_read_element_factory():
+    registry = tree.ElementRegistry()
+
+    class Link(tree.Element):
+        pass
+    registry.register(Link, tag=tree.QName('a', html.HTMLParser.namespace))
+
+    parser = html.HTMLParser(builder=tree.TreeBuilder(element_factory=registry))
+    parser.feed('<p><a href="x">y</a></p>')
+    elem = parser.close()
+    assert elem.__class__ is tree.Element
+    assert elem[0].__class__ is Link
+    assert elem[0].get(tree.QName('href', html.HTMLParser.namespace)) == 'x'
+
+def test_read_limits():
+    limits = tree.ParseLimits(max_depth=2, max_text=5)
+    parser = html.HTMLParser(limits=limits)
+    parser.feed('<a><b>12345</b></a>')
+    parser.close()
+
+    parser = html.HTMLParser(limits=limits)
+    with pytest.raises(tree.ParseLimitError):
+        parser.feed('<a><b><c /></b></a>')
+
+    parser = html.HTMLParser(limits=limits)
+    with pytest.raises(tree.ParseLimitError):
+        parser.feed('<a><b>123456</b></a>')
+
+
+def test_read_bulk():
+    import gc
+
+    enabled = gc.isenabled()
+    try:
+        parser = html.HTMLParser(bulk=True)
+        parser.feed('<html><body><p>a</p>')
+        assert not gc.isenabled()
+        parser.feed('</body></html>')
+        elem = parser.close()
+        assert gc.isenabled()
+        assert parser.bulk.stats()['collections'] == (0, 0, 0)
+    finally:
+        # a failed assertion must not leave the collector off
+        if enabled:
+            gc.enable()
@@ -0,0 +1,94 @@
+import pytest
+
+from .. import tree
+from ..incremental import IncrementalDocument
+from .test_tree import serialize
+
+def check(doc):
+    assert serialize(doc.root) == serialize(tree.XML(doc.text.encode('utf-8')))
+    for elem in doc.root.iter_elements_tree():
+        start, end = doc.span(elem)
+        source = doc.text[start:end]
+        assert source[1:].split()[0].split('>')[0].split(':')[-1].rstrip('/') == elem.tag.name
+        assert source.endswith('>')
+
+def test_edit_text():
+    doc = IncrementalDocument('<a><b>x</b><c y="1"><d>t</d><e /></c></a>')
+    b, c = doc.root[0], doc.root[1]
+    start = doc.text.index('t</d>')
+    elem = doc.edit(start, start + 1, 'text')
+    assert elem.tag == 'd'
+    assert doc.root[0] is b
+    assert doc.root[1] is c
+    assert c[0] is elem
+    check(doc)
+
+def test_edit_attribute():
+    doc = IncrementalDocument('<a><b>x</b><c y="1"><e /></c><f>ü</f></a>')
+    f = doc.root[2]
+    start = doc.text.index('1"')
+    elem = doc.edit(start, start + 1, '2>')
+    assert elem.tag == 'c'
+    assert elem.get('y') == '2>'
+    assert doc.root[2] is f
+    check(doc)
+    start = doc.text.index('ü')
+    elem = doc.edit(start, start + 1, 'äö')
+    assert elem is doc.root[2]
+    assert elem[0] == 'äö'
+    check(doc)
+
+def test_edit_structure():
+    doc = IncrementalDocument('<a><b><c>x</c></b><d /></a>')
+    b = doc.root[0]
+    start = doc.text.index('</c>')
+    # crosses the end of c, b is re-parsed
+    elem = doc.edit(start, start + 4, '</c><c>y</c>')
+    assert elem.tag == 'b'
+    assert elem is not b
+    assert len(elem) == 2
+    check(doc)
+    start = doc.text.index('</b>')
+    # crosses the end of b, the whole document is parsed again
+    elem = doc.edit(start, start + 4, '</b><b/>')
+    assert elem is doc.root
+    assert len(doc.root) == 3
+    check(doc)
+
+def test_edit_namespace():
+    doc = IncrementalDocument('<a xmlns="u" xmlns:p="v"><b><p:c p:x="1">x</p:c></b></a>')
+    start = doc.text.index('>x<') + 1
+    elem = doc.edit(start, start + 1, 'y')
+    assert elem.tag == tree.QName('c', 'v')
+    assert elem.get(tree.QName('x', 'v')) == '1'
+    assert elem[0] == 'y'
+    check(doc)
+
+def test_edit_redeclared():
+    # only the edited element is parsed again, within the inner declarations
+    doc = IncrementalDocument('<a xmlns="u" xmlns:p="v"><b xmlns="w"><p:c xmlns:p="x"><d>t</d></p:c></b></a>')
+    root = doc.root
+    start = doc.text.index('t<')
+    elem = doc.edit(start, start + 1, 'y')
+    assert elem is not doc.root
+    assert doc.root is root
+    assert elem.tag == tree.QName('d', 'w')
+    assert root[0][0][0] is elem
+    check(doc)
+
+def test_edit_entity():
+    doc = IncrementalDocument('<!DOCTYPE a [<!ENTITY e "entity">]><a><b>x</b></a>')
+    start = doc.text.index('x<')
+    elem = doc.edit(start, start + 1, '&e;')
+    assert elem[0] == 'entity'
+    check(doc)
+
+def test_edit_invalid():
+    doc = IncrementalDocument('<a><b>x</b></a>')
+    root = doc.root
+    start = doc.text.index('x')
+    with pytest.raises(tree.ParseError):
+        doc.edit(start, start + 1, '<')
+    assert doc.text == '<a><b>x</b></a>'
+    assert doc.root is root
+    check(doc)
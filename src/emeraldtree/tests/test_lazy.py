@@ -0,0 +1,66 @@
+from io import BytesIO
+
+from .. import lazy, tree
+
+def serialize(elem):
+    out = []
+    elem.write(out.append)
+    return ''.join(out)
+
+def test_fromstring():
+    text = '<a x="1">t<b y="2">c<d>e</d></b>u<f /><g></g><h>i</h></a>'
+    elem = lazy.fromstring(text)
+    assert elem.__class__ is tree.Element
+    assert elem.attrib == {'x': '1'}
+    assert elem[0] == 't'
+    b = elem[1]
+    assert isinstance(b, lazy.LazyElement)
+    assert b.attrib == {'y': '2'}
+    assert not b.materialized
+    assert b[0] == 'c'
+    assert b.materialized
+    assert b[1].tag == 'd'
+    assert elem[2] == 'u'
+    assert elem[3].materialized
+    assert len(elem[3]) == 0
+    assert len(elem[4]) == 0
+    assert not elem[5].materialized
+    assert elem[5].find('.') is not None
+    assert serialize(elem) == serialize(tree.XML(text))
+
+def test_fromstring_depth():
+    text = b'<?xml version="1.0" encoding="iso-8859-1"?><a><b><c>\xe4<d /></c></b></a>'
+    elem = lazy.fromstring(text, depth=2)
+    assert elem[0].__class__ is tree.Element
+    c = elem[0][0]
+    assert not c.materialized
+    assert c[0] == '\xe4'
+    assert c[1].tag == 'd'
+
+    elem = lazy.fromstring(text, depth=0)
+    assert not elem.materialized
+    assert elem.find('b/c/d') is not None
+
+def test_fromstring_context():
+    text = ('<!DOCTYPE a [<!ENTITY e "entity">]>'
+            '<a xmlns="u1" xmlns:p="u2"><b><p:c p:d="1">&e;</p:c></b></a>')
+    elem = lazy.fromstring(text)
+    c = elem[0][0]
+    assert c.tag == tree.QName('c', 'u2')
+    assert c.attrib == {tree.QName('d', 'u2'): '1'}
+    assert c[0] == 'entity'
+
+def test_fromstring_redeclared():
+    # inner declarations of a prefix replace the outer ones
+    text = '<r xmlns="u" xmlns:p="v"><s xmlns="w"><p:t xmlns:p="x"><a /><p:b /></p:t></s></r>'
+    elem = lazy.fromstring(text)
+    assert elem[0][0].tag == tree.QName('t', 'x')
+    elem = lazy.fromstring(text, depth=2)
+    t = elem[0][0]
+    assert not t.materialized
+    assert t[0].tag == tree.QName('a', 'w')
+    assert t[1].tag == tree.QName('b', 'x')
+
+def test_parse():
+    elem = lazy.parse(BytesIO(b'<a><b>c</b></a>')).getroot()
+    assert elem[0][0] == 'c'
@@ -0,0 +1,82 @@
+import pytest
+
+from .. import html, tree
+from ..parallel import parse_many, _pack, _Unpacker
+from .test_tree import serialize
+
+DOCS = [
+    '<a xmlns="u" xmlns:p="v"><b p:c="1">x<?t d?>y</b><c /></a>',
+    b'<?xml version="1.0" encoding="iso-8859-1"?><a>\xe4</a>',
+    '<a><b></a>',
+    '<a>' + '<b>text</b>' * 100 + '</a>',
+]
+
+def test_pack():
+    root = tree.XML(DOCS[0])
+    root.append(tree.Comment('c'))
+    assert serialize(_Unpacker().unpack(*_pack(root))) == serialize(root)
+
+@pytest.mark.parametrize('processes', [1, 2])
+def test_parse_many(processes):
+    results = list(parse_many(DOCS, processes=processes, chunksize=1))
+    assert [index for index, root, error in results] == [0, 1, 2, 3]
+    for index, root, error in results:
+        if index == 2:
+            assert root is None
+            assert isinstance(error, tree.ParseError)
+            assert error.position == (1, 8)
+        else:
+            assert error is None
+            assert serialize(root) == serialize(tree.XML(DOCS[index]))
+    assert results[0][1][0].tag == tree.QName('b', 'u')
+
+def test_parse_many_unordered():
+    results = parse_many(DOCS[:2] * 5, processes=2, chunksize=2, ordered=False)
+    results = sorted(results, key=lambda result: result[0])
+    assert [index for index, root, error in results] == list(range(10))
+    assert [root[0] for index, root, error in results[1::2]] == ['\xe4'] * 5
+
+def test_parse_many_html():
+    class Page(tree.Element):
+        pass
+
+    results = list(parse_many(['<p>a<br>b</p>'], parser=html.HTMLParser, processes=1,
+                              element_factory=Page))
+    index, root, error = results[0]
+    assert isinstance(root, Page)
+    assert serialize(root) == serialize(html.HTML('<p>a<br>b</p>'))
+
+RECORDS = ('<?xml version="1.0"?>\n<!DOCTYPE r [<!ENTITY e "entity">]>\n'
+           '<r xmlns="u" xmlns:p="v"><!-- <q> -->\n'
+           + ''.join('  <p:rec n="{0}">&e; {0}<p:rec /><x a=">"/></p:rec>\n'.format(i) for i in range(50))
+           + '  <p:rec />\n</r>\n')
+
+@pytest.mark.parametrize('processes', [1, 2])
+def test_iterrecords(processes):
+    from io import BytesIO
+    from ..parallel import iterrecords, _RecordReader
+
+    expected = [serialize(elem) for elem in tree.XML(RECORDS).iter_elements()]
+    source = BytesIO(RECORDS.encode('utf-8'))
+    records = list(iterrecords(source, processes=processes, batch_size=7))
+    assert [serialize(elem) for elem in records] == expected
+    assert records[3].tag == tree.QName('rec', 'v')
+    assert records[3][0] == 'entity 3'
+
+    # records split over reads
+    reader = _RecordReader(BytesIO(RECORDS.encode('utf-8')), 'p:rec')
+    reader.read_size = 16
+    reader.head()
+    assert len(list(reader)) == 51
+
+def test_iterrecords_empty(tmp_path):
+    from ..parallel import iterrecords
+
+    path = tmp_path / 'doc.xml'
+    path.write_bytes(b'<r a="1" />')
+    assert list(iterrecords(str(path), processes=1)) == []
+    path.write_bytes(b'<r></r>')
+    assert list(iterrecords(str(path), processes=1)) == []
+    path.write_bytes(b'<r><a><b></a></r>')
+    with pytest.raises(tree.ParseError):
+        list(iterrecords(str(path), processes=1))
@@ -0,0 +1,78 @@
+from io import BytesIO
+
+from .. import tree
+from ..store import StoredTree, parse
+from .test_tree import serialize
+
+DOC = b'<a xmlns:p="u"><b p:c="1">x</b><d>y<e>z</e></d></a>'
+
+def test_parse(tmp_path):
+    path = str(tmp_path / 'doc.db')
+    stored = parse(BytesIO(DOC), path, cache_size=2)
+    root = stored.getroot()
+    assert isinstance(root, tree.Element)
+    assert serialize(root) == serialize(tree.XML(DOC))
+    assert [e.tag for e in stored.iter() if isinstance(e, tree.Element)] == ['a', 'b', 'd', 'e']
+    assert stored.findtext('d/e') == 'z'
+    assert root.find('b').get(tree.QName('c', 'u')) == '1'
+    assert stored.evictions > 0
+    stored.close()
+
+    stored = StoredTree(path)
+    assert serialize(stored.getroot()) == serialize(tree.XML(DOC))
+
+def test_modify(tmp_path):
+    path = str(tmp_path / 'doc.db')
+    stored = parse(BytesIO(DOC), path, cache_size=1)
+    root = stored.getroot()
+    b, d = root
+    b.set('n', '2')
+    e = d.find('e')
+    d.remove(e)
+    b.append(e)
+    new = tree.Element('f', children=[tree.Element('g'), 'text', tree.Comment(' c ')])
+    root.insert(0, new)
+    for elem in root.iter():
+        pass
+    expected = serialize(root)
+    assert expected == ('<a><f><g />text<!-- c --></f><b n="2" ns0:c="1" xmlns:ns0="u">x'
+                        '<e>z</e></b><d>y</d></a>')
+    stored.close()
+
+    stored = StoredTree(path, cache_size=1)
+    assert serialize(stored.getroot()) == expected
+    root = stored.getroot()
+    root.remove(root.find('b'))
+    root.find('f').clear()
+    stored.flush()
+    assert serialize(root) == '<a><f /><d>y</d></a>'
+    stored.close()
+
+    stored = StoredTree(path)
+    assert serialize(stored.getroot()) == '<a><f /><d>y</d></a>'
+    count = stored._db.execute('SELECT count(*) FROM nodes').fetchone()[0]
+    assert count == 4
+
+def test_cache_lru(tmp_path):
+    doc = b'<a>' + b'<b><c /></b>' * 200 + b'</a>'
+    stored = parse(BytesIO(doc), str(tmp_path / 'doc.db'), cache_size=10)
+    root = stored.getroot()
+    for i in range(200):
+        # the root is used on every access and stays loaded
+        root[i].find('c')
+    assert stored.loads == 201
+    assert stored.evictions == 191
+
+    # the children of the root keep their identity
+    victim = root.find('b')
+    for i in range(1, 200):
+        root[i].set('n', str(i))
+    root.remove(victim)
+    stored.flush()
+    assert len(root) == 199
+    assert root[0].get('n') == '1'
+    stored.close()
+
+    stored = StoredTree(str(tmp_path / 'doc.db'))
+    assert len(stored.getroot()) == 199
+    assert stored.getroot()[198].get('n') == '199'
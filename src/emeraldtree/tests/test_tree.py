@@ -420,3 +420,565 @@ def test_XMLParser_namespace_2():
     assert elem.attrib == {'d': 'e', QName('f', 'c'): 'g'}
     assert serialize(elem) == '<ns0:b d="e" ns0:f="g" xmlns:ns0="c" />'
     assert serialize(elem, namespaces={'c': ''}) == '<b d="e" f="g" xmlns="c" />'
+
+def test_XMLParser_builder_fast_path():
+    elem = XML('<a x="1">b<c y="2">d</c>e<f /></a>')
+    assert elem.tag == 'a'
+    assert elem.attrib == {'x': '1'}
+    assert isinstance(elem.tag, QName)
+    assert elem[0] == 'b'
+    assert elem[1].tag == 'c'
+    assert elem[1].attrib == {'y': '2'}
+    assert elem[1][0] == 'd'
+    assert elem[2] == 'e'
+    assert elem[3].tag == 'f'
+    assert len(elem[3]) == 0
+
+def test_XMLParser_custom_target():
+    class Builder(TreeBuilder):
+        def __init__(self):
+            super().__init__()
+            self.events = []
+
+        def start(self, tag, attrs):
+            self.events.append(('start', tag))
+            return super().start(tag, attrs)
+
+        def end(self, tag):
+            self.events.append(('end', tag))
+            return super().end(tag)
+
+    builder = Builder()
+    parser = XMLParser(target=builder)
+    parser.feed('<a><b /></a>')
+    elem = parser.close()
+    assert elem.tag == 'a'
+    assert builder.events == [('start', 'a'), ('start', 'b'), ('end', 'b'), ('end', 'a')]
+
+def test_TreeBuilder_skip():
+    parser = XMLParser(target=TreeBuilder(skip=('script', )))
+    parser.feed('<a>b<script>c<d /></script>e<f>g</f></a>')
+    elem = parser.close()
+    assert serialize(elem) == '<a>be<f>g</f></a>'
+
+    skip = lambda tag, attrib: attrib.get('class') == 'x'
+    parser = XMLParser(target=TreeBuilder(skip=skip))
+    parser.feed('<a><b class="x">c</b><b class="y">d</b></a>')
+    elem = parser.close()
+    assert serialize(elem) == '<a><b class="y">d</b></a>'
+
+def test_TreeBuilder_keep():
+    parser = XMLParser(target=TreeBuilder(keep=('b/c', '*/e')))
+    parser.feed('<a>1<b>2<c>3<x /></c><d>4</d></b><b><e>5</e></b><f>6</f></a>')
+    elem = parser.close()
+    assert serialize(elem) == '<a><b><c>3<x /></c></b><b><e>5</e></b></a>'
+
+    parser = XMLParser(target=TreeBuilder(keep=('{u}b', )))
+    parser.feed('<a xmlns="u"><b>1</b><c>2</c></a>')
+    elem = parser.close()
+    assert serialize(elem, namespaces={'u': ''}) == '<a xmlns="u"><b>1</b></a>'
+
+    # the root is kept even if no path matches
+    parser = XMLParser(target=TreeBuilder(keep=('a/b', )))
+    parser.feed('<a>1<b>2</b></a>')
+    assert serialize(parser.close()) == '<a />'
+
+    parser = XMLParser(target=TreeBuilder(keep=(('b', 'c'), )))
+    parser.feed('<a><b><c /></b></a>')
+    assert serialize(parser.close()) == '<a><b><c /></b></a>'
+
+@pytest.mark.parametrize('keep', [('', ), ('b//c', ), ('/b', ), ('b/', ), (('b', ''), ), 'b/c'])
+def test_TreeBuilder_keep_invalid(keep):
+    with pytest.raises(ValueError):
+        TreeBuilder(keep=keep)
+
+def test_ElementRegistry():
+    registry = ElementRegistry()
+
+    @registry.register(tag='a')
+    class A(Element):
+        pass
+
+    @registry.register(namespace='u')
+    class U(Element):
+        pass
+
+    class V(Element):
+        pass
+    registry.register(V, tag='{u}v')
+
+    assert registry.lookup(QName('a')) is A
+    assert registry.lookup(QName('x', 'u')) is U
+    assert registry.lookup(QName('v', 'u')) is V
+    assert registry.lookup(QName('x')) is Element
+    pytest.raises(ValueError, registry.register, A)
+
+    parser = XMLParser(target=TreeBuilder(element_factory=registry))
+    parser.feed('<b><a x="1" /><c xmlns="u"><v /></c></b>')
+    elem = parser.close()
+    assert elem.__class__ is Element
+    assert elem[0].__class__ is A
+    assert elem[0].attrib == {'x': '1'}
+    assert elem[1].__class__ is U
+    assert elem[1][0].__class__ is V
+    assert len(list(elem.iter_elements_tree())) == 4
+    assert serialize(elem) == '<b><a x="1" /><ns0:c xmlns:ns0="u"><ns0:v /></ns0:c></b>'
+
+def test_TreeBuilder_intern():
+    interner = Interner(max_length=10)
+    parser = XMLParser(target=TreeBuilder(intern=interner))
+    parser.feed('<a><b c="nofollow" d="%s">xy</b><b c="nofollow" d="%s">xy</b></a>' % ('y' * 20, 'y' * 20))
+    elem = parser.close()
+    b1, b2 = elem
+    assert b1.get('c') == 'nofollow'
+    assert b1.get('c') is b2.get('c')
+    assert b1[0] is b2[0]
+    assert b1.get('d') == b2.get('d')
+    assert b1.get('d') is not b2.get('d')
+    stats = interner.stats()
+    assert stats['hits'] == 2
+    assert stats['saved'] > 0
+
+    parser = XMLParser(target=TreeBuilder(intern=interner))
+    parser.feed('<a c="nofollow" />')
+    elem = parser.close()
+    assert elem.get('c') is b1.get('c')
+
+def test_XMLParser_limits():
+    def parse(text, **kw):
+        parser = XMLParser(limits=ParseLimits(**kw))
+        parser.feed(text)
+        return parser.close()
+
+    assert parse('<a><b><c /></b></a>', max_depth=3).tag == 'a'
+    with pytest.raises(ParseLimitError) as info:
+        parse('<a><b><c><d /></c></b></a>', max_depth=3)
+    assert info.value.limit == 'max_depth'
+    assert info.value.position[0] == 1
+
+    with pytest.raises(ParseLimitError) as info:
+        parse('<a>' + '<b />' * 10 + '</a>', max_elements=10)
+    assert info.value.limit == 'max_elements'
+
+    with pytest.raises(ParseLimitError) as info:
+        parse('<a b="1" c="2" d="3" />', max_attributes=2)
+    assert info.value.limit == 'max_attributes'
+
+    assert len(parse('<a>' + 'x' * 10 + '</a>', max_text=10)[0]) == 10
+    with pytest.raises(ParseLimitError) as info:
+        parse('<a>' + 'x' * 11 + '</a>', max_text=10)
+    assert info.value.limit == 'max_text'
+
+def test_XMLParser_limits_entities():
+    doc = ('<!DOCTYPE a [<!ENTITY e "x&amp;"><!ENTITY f "&e;&e;&e;">]>'
+           '<a>&f;&f;</a>')
+    parser = XMLParser(limits=ParseLimits(max_entity_expansions=8))
+    parser.feed(doc)
+    elem = parser.close()
+    assert elem[0] == 'x&' * 6
+
+    parser = XMLParser(limits=ParseLimits(max_entity_expansions=7))
+    with pytest.raises(ParseLimitError) as info:
+        parser.feed(doc)
+    assert info.value.limit == 'max_entity_expansions'
+
+    # a single entity above the limit is rejected at the declaration
+    parser = XMLParser(limits=ParseLimits(max_entity_expansions=3))
+    with pytest.raises(ParseLimitError):
+        parser.feed('<!DOCTYPE a [<!ENTITY e "x"><!ENTITY f "&e;&e;&e;">]><a b="&f;" />')
+
+@pytest.mark.parametrize('encoding', ['utf-8', 'utf-16'])
+def test_XMLParser_limits_entities_attributes(encoding):
+    # references expanded by expat in attribute values count to the total
+    doc = ('<?xml version="1.0" encoding="%s"?><!DOCTYPE a [<!ENTITY a "xxx"><!ENTITY b "%s">]>'
+           '<a c="&b;&amp;&#65;"><d e="1" f=\'%s\' /></a>' % (encoding, '&a;' * 30, '&b;' * 30))
+    parser = XMLParser(limits=ParseLimits(max_entity_expansions=31 * 31))
+    parser.feed(doc.encode(encoding))
+    elem = parser.close()
+    assert elem.get('c') == 'x' * 90 + '&A'
+    assert len(elem[0].get('f')) == 2700
+
+    parser = XMLParser(limits=ParseLimits(max_entity_expansions=31 * 31 - 1))
+    with pytest.raises(ParseLimitError) as info:
+        parser.feed(doc.encode(encoding))
+        parser.close()
+    assert info.value.limit == 'max_entity_expansions'
+
+def test_TreeBuilder_chunk_text():
+    parser = XMLParser(target=TreeBuilder(chunk_text=100))
+    parser.feed('<a><b>short</b><c>')
+    for i in range(50):
+        parser.feed('&lt;&amp;>' * 10)
+    parser.feed('</c></a>')
+    elem = parser.close()
+    b, c = elem
+    assert b[0] == 'short'
+    assert isinstance(c[0], ChunkedText)
+    assert len(c[0]) == 1500
+    assert c.text == '<&>' * 500
+    assert ''.join(elem.itertext()) == 'short' + '<&>' * 500
+    assert serialize(elem) == '<a><b>short</b><c>' + '&lt;&amp;&gt;' * 500 + '</c></a>'
+
+def test_TreeBuilder_chunk_text_siblings():
+    # the threshold applies to every text node on its own
+    parser = XMLParser(target=TreeBuilder(chunk_text=100))
+    parser.feed('<a><b>' + 'x' * 60 + '</b><c>' + 'y' * 50 + '</c>' + 'z' * 70 + '<d />' + 'w' * 40 + '</a>')
+    elem = parser.close()
+    assert not any(isinstance(node, ChunkedText) for node in elem.iter())
+    assert elem[1][0] == 'y' * 50
+    assert elem[4] == 'w' * 40
+
+def test_TreeBuilder_spill_text():
+    parser = XMLParser(target=TreeBuilder(spill_text=1000))
+    parser.feed('<a>')
+    for i in range(100):
+        parser.feed('ä\r\n' * 100)
+    parser.feed('</a>')
+    elem = parser.close()
+    text = elem[0]
+    assert text._file is not None
+    assert len(text) == 20000
+    text.read_size = 1024
+    assert max(len(chunk) for chunk in text) == 1024
+    assert str(text) == 'ä\n' * 10000
+    assert serialize(elem) == '<a>' + 'ä\n' * 10000 + '</a>'
+
+def test_XMLParser_feed_steps():
+    doc = '<a>' + '<b c="1">text</b>' * 1000 + '</a>'
+    parser = XMLParser()
+    steps = 0
+    for _ in parser.feed_steps(doc, max_bytes=1000):
+        steps += 1
+    elem = parser.close()
+    assert steps == 18
+    assert len(elem) == 1000
+
+    parser = XMLParser()
+    for _ in parser.feed_steps(doc.encode('ascii'), max_bytes=100, max_time=10):
+        pass
+    assert len(parser.close()) == 1000
+
+@pytest.mark.parametrize('method', ['xml', 'html', 'polyglot', 'text'])
+def test_write_steps(method):
+    elem = XML('<a xmlns="u" xmlns:p="v"><b p:c="1">x<br /><script>1 &lt; 2</script></b><p:d>y</p:d></a>')
+    expected = StringIO()
+    elem.write(expected.write, method=method, document=True)
+
+    result = StringIO()
+    steps = list(elem.write_steps(result.write, method=method, document=True))
+    assert result.getvalue() == expected.getvalue()
+    assert len(steps) >= 3
+
+    result = StringIO()
+    batched = list(elem.write_steps(result.write, method=method, max_nodes=4))
+    assert len(batched) <= len(steps) // 4 + 1
+    result = StringIO()
+    for _ in elem.write_steps(result.write, method=method, max_time=10):
+        pass
+    assert result.getvalue() == serialize_method(elem, method)
+
+def serialize_method(elem, method):
+    file = StringIO()
+    elem.write(file.write, method=method)
+    return file.getvalue()
+
+def test_BulkBuild():
+    import gc
+
+    doc = '<a>' + '<b c="1"><d /></b>' * 20000 + '</a>'
+    enabled = gc.isenabled()
+    try:
+        measure = BulkBuild(disable=False)
+        with measure:
+            XML(doc)
+        assert sum(measure.collections) > 0
+        assert measure.pause > 0
+
+        bulk = BulkBuild()
+        parser = XMLParser(bulk=bulk)
+        parser.feed(doc)
+        assert not gc.isenabled()
+        assert len(parser.close()) == 20000
+        assert gc.isenabled()
+        assert bulk.stats()['collections'] == (0, 0, 0)
+
+        parser = XMLParser(bulk=True)
+        with pytest.raises(ParseError):
+            parser.feed('<a></b>')
+        assert gc.isenabled()
+
+        bulk = BulkBuild(freeze=True)
+        with bulk:
+            elem = XML(doc)
+        assert bulk.stats()['frozen'] > 60000
+    finally:
+        # a failed assertion must not leave the collector off
+        gc.unfreeze()
+        if enabled:
+            gc.enable()
+
+def test_ContentModel():
+    model = ContentModel({
+        'doc': {'children': ['p', '{u}note'], 'attributes': ['lang'], 'text': False},
+        'p': {'children': ['em'], 'attributes': ['class', 'id'], 'required': ['id']},
+        'em': {},
+        '{u}note': {'children': None, 'attributes': None},
+    }, root=['doc'])
+
+    def parse(text):
+        parser = XMLParser(target=TreeBuilder(validator=model))
+        parser.feed(text)
+        return parser.close()
+
+    elem = parse('<doc lang="en">\n <p id="1">a<em>b</em></p><n:note xmlns:n="u" x="1"><em /></n:note>\n</doc>')
+    assert model.errors(elem) == []
+    model.validate(elem)
+
+    for text, tag in [
+        ('<p id="1" />', 'p'),
+        ('<doc><em /></doc>', 'em'),
+        ('<doc x="1" />', 'doc'),
+        ('<doc><p /></doc>', 'p'),
+        ('<doc>text</doc>', 'doc'),
+        ('<doc><p id="1"><b /></p></doc>', 'b'),
+    ]:
+        with pytest.raises(ValidationError) as info:
+            parse(text)
+        assert info.value.tag == tag
+        assert info.value.position[0] == 1
+
+    elem = Element('doc', children=['text', Element('p'), Element('p', id='1', children=[Element('x')])])
+    errors = model.errors(elem)
+    assert [(err.tag, str(err)) for err in errors] == [
+        ('doc', 'text not permitted in doc'),
+        ('p', 'attribute id required in p'),
+        ('x', 'element x not permitted in p'),
+    ]
+    with pytest.raises(ValidationError):
+        model.validate(elem)
+
+    loose = ContentModel({'doc': {'children': ['x']}}, strict=False)
+    loose.validate(XML('<doc><x a="1"><y /></x></doc>'))
+
+def test_XMLWriter_namespace_scope():
+    elem = XML('<a><b xmlns="u"><c xmlns:p="v" p:d="1" /></b><e xmlns="u" /><f /></a>')
+    expected = ('<a><ns0:b xmlns:ns0="u"><ns0:c ns1:d="1" xmlns:ns1="v" /></ns0:b>'
+                '<ns0:e xmlns:ns0="u" /><f /></a>')
+    assert serialize(elem) == expected
+    assert serialize(elem, namespaces={'u': ''}) == expected.replace('ns0:', '').replace(':ns0', '')
+    # written again inside a transparent element
+    wrapper = Element(None, children=[elem[0], elem[1]])
+    assert serialize(wrapper) == ('<ns0:b xmlns:ns0="u"><ns0:c ns1:d="1" xmlns:ns1="v" /></ns0:b>'
+                                  '<ns0:e xmlns:ns0="u" />')
+    result = StringIO()
+    list(elem.write_steps(result.write))
+    assert result.getvalue() == expected
+
+def test_XMLWriter_escape_attrib():
+    value = 'a&b<c>"d"\ne'
+    expected = '<x a="a&amp;b&lt;c&gt;&quot;d&quot;&#10;e" b="plain">&lt;&amp;&gt;"</x>'
+    for i in range(3):
+        # the second round is served from the cache of escaped values
+        elem = Element('x', a=value, b='plain', children=['<&>"'])
+        assert serialize(elem) == expected
+    assert serialize(Element('x', a=1)) == '<x a="1" />'
+    assert serialize(Element('x', a='x' * 1000)) == '<x a="{}" />'.format('x' * 1000)
+
+@pytest.mark.parametrize('method', ['xml', 'html', 'polyglot'])
+def test_write_attrib_quote_newline(method):
+    # & is escaped first, so the references for " and newline stay intact
+    elem = Element('x', a='say "hi"\nbye &amp;')
+    result = serialize_method(elem, method)
+    assert 'a="say &quot;hi&quot;&#10;bye &amp;amp;"' in result
+    assert XML(result).get('a') == 'say "hi"\nbye &amp;'
+
+def test_XMLWriter_reuse():
+    writer = XMLWriter(sort_attributes=False)
+    elem = XML('<a z="1" y="2"><b z="3" y="4" /><c xmlns="u" x="5" /></a>')
+    for i in range(2):
+        result = StringIO()
+        writer.write(result.write, elem)
+        assert result.getvalue() == '<a z="1" y="2"><b z="3" y="4" /><ns0:c x="5" xmlns:ns0="u" /></a>'
+    assert serialize(elem) == '<a y="2" z="1"><b y="4" z="3" /><ns0:c x="5" xmlns:ns0="u" /></a>'
+
+    result = StringIO()
+    elem.write(result.write, sort_attributes=False, method='polyglot')
+    assert result.getvalue() == '<a z="1" y="2"><b z="3" y="4"></b><ns0:c x="5" xmlns:ns0="u"></ns0:c></a>'
+
+    # a writer is shared between threads
+    from concurrent.futures import ThreadPoolExecutor
+    def write(i):
+        result = StringIO()
+        writer.write(result.write, Element('x', children=[Element('y', a=str(i), b='c')] * 100))
+        return result.getvalue()
+    with ThreadPoolExecutor(4) as pool:
+        results = list(pool.map(write, range(8)))
+    assert results[5] == '<x>' + '<y a="5" b="c" />' * 100 + '</x>'
+
+def test_write_deep():
+    depth = 10000
+    root = elem = Element('a')
+    for i in range(depth):
+        child = Element('a', children=['x'])
+        elem.append(child)
+        elem = child
+    assert serialize(root) == '<a>' + '<a>x' * depth + '</a>' * (depth + 1)
+    for method in 'html', 'polyglot':
+        assert serialize_method(root, method).count('</a>') == depth + 1
+    assert serialize_method(root, 'text') == 'x' * depth
+    result = StringIO()
+    list(root.write_steps(result.write, max_nodes=1000))
+    assert result.getvalue() == serialize(root)
+
+def test_tostring():
+    elem = XML('<a b="1">\xe9<c /></a>')
+    assert tostring(elem) == b'<a b="1">&#233;<c /></a>'
+    assert tostring(elem, 'utf-8') == '<a b="1">\xe9<c /></a>'.encode('utf-8')
+    assert tostringlist(elem, method='html') == [b'<a b="1">&#233;<c></c></a>']
+
+def test_BufferedSink():
+    from io import BytesIO
+
+    class Socket:
+        def __init__(self):
+            self.sent = []
+        def sendall(self, data):
+            self.sent.append(data)
+
+    elem = Element('a', children=[Element('b', children=['\xe9' * 10])] * 100)
+    expected = serialize(elem).encode('ascii', 'xmlcharrefreplace')
+
+    socket = Socket()
+    with BufferedSink(socket, 'us-ascii', flush_size=100) as sink:
+        elem.write(sink.write)
+    assert b''.join(socket.sent) == expected
+    assert 10 < len(socket.sent) < 100
+
+    f = BytesIO()
+    ElementTree(elem).write(f)
+    assert f.getvalue() == expected
+
+    # encoded write_steps flush the sink before every step
+    result = []
+    for i in elem.write_steps(result.append, encoding='us-ascii', max_nodes=50):
+        assert b''.join(result) == expected[:len(b''.join(result))]
+    assert b''.join(result) == expected
+    assert len(result) > 3
+
+def test_BufferedSink_encoding():
+    elem = Element('a', children=[Element('b', children=['x\xe9€あ'])] * 50)
+    text = serialize(elem)
+    for encoding in 'utf-8', 'us-ascii', 'latin-1', 'cp1252', 'utf-16', 'utf-8-sig', 'iso-2022-jp':
+        result = []
+        with BufferedSink(result.append, encoding, flush_size=64) as sink:
+            elem.write(sink.write)
+        assert len(result) > 5
+        data = b''.join(result)
+        # a BOM is written once, not per block
+        assert data.decode(encoding).replace('&#233;', '\xe9').replace('&#8364;', '€').replace('&#12354;', 'あ') == text
+    assert b''.join(result).count(b'&#') == 100
+
+def test_iterwrite():
+    elem = Element('html', children=[Element('p', children=['text \xe9'])] * 1000)
+    chunks = iterwrite(elem, encoding='utf-8', chunk_size=1000)
+    first = next(chunks)
+    assert isinstance(first, bytes)
+    assert len(first) >= 1000
+    rest = list(chunks)
+    assert len(rest) > 5
+    assert first + b''.join(rest) == tostring(elem, 'utf-8')
+
+    for method in 'html', 'polyglot':
+        assert b''.join(iterwrite(ElementTree(elem), method=method)) == tostring(elem, method=method)
+    # writers yield str without encoding
+    assert ''.join(XMLWriter().iterwrite(elem, chunk_size=100)) == serialize(elem)
+
+def test_write_async():
+    import asyncio
+
+    class Stream:
+        def __init__(self):
+            self.data = []
+            self.drains = 0
+        def write(self, data):
+            self.data.append(data)
+        async def drain(self):
+            self.drains += 1
+
+    elem = Element('html', children=[Element('p', children=['text \xe9'])] * 1000)
+    ticks = []
+
+    async def ticker():
+        while True:
+            ticks.append(len(ticks))
+            await asyncio.sleep(0)
+
+    async def main():
+        task = asyncio.ensure_future(ticker())
+        stream = Stream()
+        await elem.write_async(stream, encoding='utf-8', chunk_size=1000)
+        assert stream.drains == len(stream.data) > 5
+        assert b''.join(stream.data) == serialize(elem).encode('utf-8')
+        # other tasks run while the tree is written
+        assert len(ticks) >= len(stream.data)
+
+        blocks = []
+        async def callback(data):
+            blocks.append(data)
+        await ElementTree(elem).write_async(callback, method='html')
+        assert b''.join(blocks) == tostring(elem, method='html')
+        task.cancel()
+
+    asyncio.run(main())
+
+def test_write_async_stream():
+    # a real StreamWriter takes bytes only, the default encoding is us-ascii
+    import asyncio
+
+    elem = Element('a', children=['text \xe9'])
+    received = []
+
+    async def handle(reader, writer):
+        received.append(await reader.read())
+        writer.close()
+
+    async def main():
+        server = await asyncio.start_server(handle, '127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        await elem.write_async(writer)
+        writer.write_eof()
+        await reader.read()
+        writer.close()
+        server.close()
+        await server.wait_closed()
+        with pytest.raises(ValueError):
+            await XMLWriter().write_async(writer, elem)
+
+    asyncio.run(main())
+    assert received == [b'<a>text &#233;</a>']
+
+def test_C14NWriter():
+    import xml.etree.ElementTree as ET
+
+    text = '<a z="1" b="x&#9;&#13;&#10;&quot;&lt;&gt;y"><b/>t&#13;&gt;<c x="&apos;"/>\n</a>'
+    elem = XML(text)
+    assert serialize_method(elem, 'c14n') == ET.canonicalize(text)
+
+    elem = XML('<a xmlns:p="u" p:y="2" z="1"><p:c xmlns="v"><d /></p:c></a>')
+    elem.append(Comment('c'))
+    assert serialize_method(elem, 'c14n') == ('<a xmlns:ns0="u" z="1" ns0:y="2">'
+                                              '<ns0:c><ns1:d xmlns:ns1="v"></ns1:d></ns0:c></a>')
+    assert tostring(elem, method='c14n') == serialize_method(elem, 'c14n').encode('utf-8')
+
+def test_canonical_digest():
+    import hashlib
+
+    elem1 = XML('<a y="2" x="1">\xe9<b /></a>')
+    elem2 = Element('a', {'x': '1', 'y': '2'}, children=['\xe9', Element('b')])
+    digest = canonical_digest(elem1).hexdigest()
+    assert digest == canonical_digest(ElementTree(elem2)).hexdigest()
+    assert digest == hashlib.sha256(tostring(elem1, method='c14n')).hexdigest()
+    elem2.set('x', '3')
+    assert canonical_digest(elem2).hexdigest() != digest
+    assert canonical_digest(elem1, 'md5').digest_size == 16
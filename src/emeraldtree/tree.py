@@ -27,16 +27,24 @@ __all__ = [
     # public symbols
     "Comment",
     "dump",
-    "Element", "ElementTree",
+    "BufferedSink",
+    "BulkBuild",
+    "canonical_digest",
+    "ChunkedText",
+    "ContentModel",
+    "Element", "ElementRegistry", "ElementTree",
     "fromstring", "fromstringlist",
+    "Interner",
     "iterparse",
+    "iterwrite",
     "Node",
-    "parse", "ParseError",
+    "parse", "ParseError", "ParseLimitError", "ParseLimits",
     "PI", "ProcessingInstruction",
     "QName",
     "SubElement",
     "tostring", "tostringlist",
     "TreeBuilder",
+    "ValidationError",
     "XML",
     "XMLParser", "XMLWriter",
     ]
@@ -63,11 +71,38 @@ __all__ = [
 # structure, and convert it from and to XML.
 ##
 
+import codecs
+import gc
+import hashlib
+import re
+import sys
+
 from . import ElementPath
 
 class ParseError(SyntaxError):
     pass
 
+##
+# Raised if a document exceeds one of the configured {@link #ParseLimits}.
+# The name of the exceeded limit is available as the <b>limit</b>
+# attribute.
+
+class ParseLimitError(ParseError):
+
+    def __init__(self, msg, limit):
+        ParseError.__init__(self, msg)
+        self.limit = limit
+
+##
+# Raised if an element violates a {@link #ContentModel}.  The tag of the
+# element is available as the <b>tag</b> attribute.
+
+class ValidationError(ParseError):
+
+    def __init__(self, msg, tag):
+        ParseError.__init__(self, msg)
+        self.tag = tag
+
 # --------------------------------------------------------------------
 
 class Node:
@@ -75,17 +110,36 @@ class Node:
     Node class.
     """
 
-    def write(self, write, encoding=None, namespaces={}, method=None, document=False):
-        if not method or method == "xml":
-            Writer = XMLWriter
-        elif method == "html":
-            Writer = HTMLWriter
-        elif method == "polyglot":
-            Writer = PolyglotWriter
-        else:
-            Writer = TextWriter
+    def write(self, write, encoding=None, namespaces={}, method=None, document=False,
+              sort_attributes=True, fragments=None):
+        writer = _writer(method, encoding, namespaces, sort_attributes, fragments)
+        writer.write(write, self, document=document)
+
+    def write_steps(self, write, encoding=None, namespaces={}, method=None, document=False,
+                    max_nodes=None, max_time=None, sort_attributes=True, fragments=None):
+        """
+        Writes the node like write, as a generator doing a bounded amount
+        of work per step, see BaseWriter.write_steps.
+        """
+        writer = _writer(method, encoding, namespaces, sort_attributes, fragments)
+        return writer.write_steps(write, self, document=document,
+                                  max_nodes=max_nodes, max_time=max_time)
+
+    async def write_async(self, target, encoding="us-ascii", namespaces={}, method=None, document=False,
+                          chunk_size=65536, sort_attributes=True, fragments=None):
+        """
+        Writes the node like write, to an asyncio stream.  Streams take
+        bytes, so the output is always encoded, by default as US-ASCII.
 
-        Writer(encoding, namespaces).write(write, self, document=document)
+        @param target: asyncio.StreamWriter, or a coroutine function called
+            with every block
+        @param chunk_size: number of characters written between two waits
+            for the stream, see BaseWriter.write_async
+        """
+        if not encoding:
+            encoding = "us-ascii"
+        writer = _writer(method, encoding, namespaces, sort_attributes, fragments)
+        await writer.write_async(target, self, document=document, chunk_size=chunk_size)
 
 
 ##
@@ -127,8 +181,12 @@ class Element(Node):
 
     @property
     def text(self):
-        if len(self) and isinstance(self[0], str):
-            return self[0]
+        if len(self):
+            text = self[0]
+            if isinstance(text, str):
+                return text
+            if isinstance(text, ChunkedText):
+                return str(text)
 
     ##
     # (Attribute) Text after this element's end tag, but before the
@@ -366,18 +424,27 @@ class Element(Node):
     # @defreturn iterator
 
     def itertext(self):
-        for e in self:
-            if isinstance(e, Element):
-                yield from e.itertext()
-            elif isinstance(e, str):
-                yield e
+        # iterators over the children of the open elements, so deep trees
+        # do not nest generators
+        work = [iter(self)]
+        while work:
+            for e in work[-1]:
+                if isinstance(e, Element):
+                    work.append(iter(e))
+                    break
+                elif isinstance(e, str):
+                    yield e
+                elif isinstance(e, ChunkedText):
+                    yield from e
+            else:
+                work.pop()
 
     def iter_elements(self):
         """
         Creates an interator over all direct element children.
         """
         for child in self._children:
-            if child.__class__ is Element:
+            if isinstance(child, Element):
                 yield child
 
     def iter_elements_tree(self):
@@ -445,6 +512,152 @@ class ProcessingInstruction(Node):
 
 PI = ProcessingInstruction
 
+##
+# Text node stored as a sequence of chunks.  Used by the
+# {@link #TreeBuilder} for large character data, which is never joined
+# into a single string; the writers write it chunk by chunk.  Above the
+# spill size the text is moved to an anonymous temporary file.
+# <p>
+# The text is available with str(), or chunk by chunk by iterating over
+# the node.
+#
+# @param chunks Optional sequence of strings.
+# @keyparam spill Optional size in characters, above which the text is
+#    stored in a temporary file.
+
+class ChunkedText(Node):
+
+    ##
+    # Size of the chunks read back from the temporary file.
+
+    read_size = 65536
+
+    def __init__(self, chunks=(), spill=None):
+        self._chunks = []
+        self._file = None
+        self._size = 0
+        self.spill = spill
+        for chunk in chunks:
+            self.append(chunk)
+
+    def __repr__(self):
+        return "<ChunkedText of {} characters at {:x}>".format(self._size, id(self))
+
+    def __len__(self):
+        return self._size
+
+    def __str__(self):
+        return "".join(self)
+
+    ##
+    # Returns a copy with its own chunks, and its own temporary file if
+    # the text was moved to one, so appends do not affect the original.
+
+    def __copy__(self):
+        cls = self.__class__
+        new = cls.__new__(cls)
+        new.__dict__.update(self.__dict__)
+        new._chunks = list(self._chunks)
+        if self._file is not None:
+            new._file = self._open_file()
+            new._file.writelines(self)
+        return new
+
+    def __deepcopy__(self, memo):
+        return self.__copy__()
+
+    def __iter__(self):
+        if self._file is None:
+            return iter(self._chunks)
+        return self._iter_file()
+
+    def _iter_file(self):
+        f = self._file
+        pos = 0
+        while True:
+            # appends in between move the file position
+            f.seek(pos)
+            chunk = f.read(self.read_size)
+            if not chunk:
+                break
+            pos = f.tell()
+            yield chunk
+
+    ##
+    # Adds text at the end.
+    #
+    # @param text A string.
+
+    def append(self, text):
+        self._size += len(text)
+        if self._file is not None:
+            self._file.seek(0, 2)
+            self._file.write(text)
+            return
+        self._chunks.append(text)
+        if self.spill is not None and self._size > self.spill:
+            self._file = self._open_file()
+            self._file.writelines(self._chunks)
+            self._chunks = []
+
+    @staticmethod
+    def _open_file():
+        import tempfile
+        return tempfile.TemporaryFile("w+", encoding="utf-8", newline="")
+
+##
+# Element factory dispatching on the element tag.  Element subclasses
+# can be registered for single tags, or for all tags of a namespace, and
+# the registry is passed as element_factory to the {@link #TreeBuilder}.
+# The parsers then create the specialized elements directly.
+#
+# @keyparam default Element class used for tags without registration.
+
+class ElementRegistry:
+
+    def __init__(self, default=Element):
+        self.default = default
+        self._tags = {}
+        self._namespaces = {}
+
+    ##
+    # Registers an element class for a tag, or for all tags within a
+    # namespace.  Registrations for tags take precedence.  If the class
+    # is omitted, a class decorator is returned.
+    #
+    # @param cls Element subclass.
+    # @keyparam tag Tag, as QName or "{uri}name" string.
+    # @keyparam namespace Namespace URI.
+
+    def register(self, cls=None, tag=None, namespace=None):
+        if (tag is None) == (namespace is None):
+            raise ValueError("either tag or namespace is needed")
+        if cls is None:
+            def decorator(cls):
+                self.register(cls, tag, namespace)
+                return cls
+            return decorator
+        if tag is not None:
+            self._tags[QName(tag)] = cls
+        else:
+            self._namespaces[namespace] = cls
+        return cls
+
+    ##
+    # Returns the element class used for a tag.
+
+    def lookup(self, tag):
+        cls = self._tags.get(tag)
+        if cls is None:
+            cls = self._namespaces.get(getattr(tag, "uri", None), self.default)
+        return cls
+
+    def __call__(self, tag, attrib):
+        cls = self._tags.get(tag)
+        if cls is None:
+            cls = self._namespaces.get(getattr(tag, "uri", None), self.default)
+        return cls(tag, attrib)
+
 class QName(str):
     """
     QName wrapper.  This can be used to wrap a QName attribute value, in
@@ -640,9 +853,37 @@ class ElementTree:
               method=None,
               namespaces={}):
         assert self._root is not None
+        if not encoding:
+            encoding = "us-ascii"
+
+        if default_namespace:
+            namespaces = namespaces.copy()
+            namespaces[default_namespace] = ''
+
         if not hasattr(file, "write"):
-            file = open(file, "wb")
-        write = file.write
+            with open(file, "wb") as f:
+                self._root.write(f.write, encoding=encoding, namespaces=namespaces, method=method, document=True)
+        else:
+            self._root.write(file.write, encoding=encoding, namespaces=namespaces, method=method, document=True)
+
+    ##
+    # Writes the element tree to an asyncio stream, as XML.  This is a
+    # coroutine, see {@link Node.write_async}.
+    #
+    # @param target An asyncio.StreamWriter, or a coroutine function called
+    #     with every encoded block.
+    # @keyparam chunk_size Number of characters written between two waits
+    #     for the stream.
+    # @see #ElementTree.write
+
+    async def write_async(self, target,
+                          # keyword arguments
+                          encoding="us-ascii",
+                          default_namespace=None,
+                          method=None,
+                          namespaces={},
+                          chunk_size=65536):
+        assert self._root is not None
         if not encoding:
             encoding = "us-ascii"
 
@@ -650,7 +891,8 @@ class ElementTree:
             namespaces = namespaces.copy()
             namespaces[default_namespace] = ''
 
-        self._root.write(write, encoding=encoding, namespaces=namespaces, method=method, document=True)
+        await self._root.write_async(target, encoding=encoding, namespaces=namespaces, method=method,
+                                     document=True, chunk_size=chunk_size)
 
 # --------------------------------------------------------------------
 # serialization support
@@ -663,15 +905,61 @@ class ElementTree:
 #
 # @param element An Element instance.
 # @return An encoded string containing the XML data.
-# @defreturn string
+# @defreturn bytes
 
 def tostring(element, encoding=None, method=None):
     data = tostringlist(element, encoding, method)
-    return "".join(data)
+    return b"".join(data)
+
+##
+# Generates a string representation of an XML element lazily, as an
+# iterator over encoded blocks.  The element is serialized while the
+# blocks are consumed, so the first block is available before the whole
+# document is serialized and only one block is held in memory.  Suited for
+# WSGI response bodies.
+#
+# @param element An Element or ElementTree instance.
+# @keyparam encoding Output encoding (default is US-ASCII).
+# @keyparam method Output method ("xml", "html", "polyglot" or "text").
+# @keyparam chunk_size Minimum number of characters per block, only the
+#     last block may be shorter.
+# @keyparam namespaces Preferred prefixes as uri -> prefix dictionary.
+# @keyparam fragments Optional cache.FragmentCache for the output of
+#     subtrees.
+# @return An iterator over bytes objects.
+# @defreturn iterator
+
+def iterwrite(element, encoding=None, method=None, chunk_size=65536, namespaces={}, fragments=None):
+    if isinstance(element, ElementTree):
+        element = element.getroot()
+    if not encoding:
+        encoding = "us-ascii"
+    writer = _writer(method, encoding, namespaces, True, fragments)
+    return writer.iterwrite(element, document=True, chunk_size=chunk_size)
+
+##
+# Computes a digest of the canonical XML of an element, see
+# {@link C14NWriter}.  The output is fed to the hash in blocks, the
+# document is not built as a whole.  Equal trees have equal digests, so
+# they are suited for ETags and cache keys.
+#
+# @param element An Element or ElementTree instance.
+# @keyparam algorithm Name of a hashlib algorithm.
+# @keyparam namespaces Preferred prefixes as uri -> prefix dictionary.
+# @return A hashlib hash object.
+
+def canonical_digest(element, algorithm="sha256", namespaces={}):
+    if isinstance(element, ElementTree):
+        element = element.getroot()
+    h = hashlib.new(algorithm)
+    sink = BufferedSink(h.update, "utf-8")
+    C14NWriter("utf-8", namespaces).write(sink.write, element)
+    return h
 
 ##
 # Generates a string representation of an XML element, including all
-# subelements.  The string is returned as a sequence of string fragments.
+# subelements.  The string is returned as a sequence of encoded blocks
+# of about {@link BaseWriter.flush_size} characters.
 #
 # @param element An Element instance.
 # @return A sequence object containing the XML data.
@@ -683,9 +971,8 @@ def tostringlist(element, encoding=None, method=None):
         pass
     data = []
     file = dummy()
-    file.write = data.append
+    file.write = data.append # the writers collect encoded output in blocks
     ElementTree(element).write(file, encoding, method=method)
-    # FIXME: merge small fragments into larger parts
     return data
 
 ##
@@ -887,16 +1174,64 @@ def fromstringlist(sequence, parser=None):
 #
 # @param element_factory Optional element factory.  This factory
 #    is called to create new Element instances, as necessary.
+# @keyparam skip Optional set of tags, or predicate called with the tag
+#    and the attribute dictionary.  Matching elements are discarded,
+#    together with their content, without creating Element instances.
+# @keyparam keep Optional sequence of paths ("body/div", relative to the
+#    root element, "*" matches any tag).  If given, only the subtrees
+#    matching one of the paths and their ancestors are kept; text outside
+#    of the kept subtrees and ancestors without matches are dropped.  The
+#    root element is always kept, if nothing matches it stays empty.
+#    Discarded elements are reported as None by start and end.  Empty
+#    paths or steps raise a ValueError.
+# @keyparam intern Optional {@link #Interner} instance, or True to use a
+#    new one.  Attribute values and short text nodes are looked up in it,
+#    so repeated values share a single string object.
+# @keyparam chunk_text Optional size in characters.  Longer text is not
+#    joined into a single string but kept as a {@link #ChunkedText} node.
+# @keyparam spill_text Optional size in characters, above which text is
+#    stored in a temporary file.  Implies chunking at that size, if
+#    chunk_text is not given.
+# @keyparam validator Optional {@link #ContentModel}, checking every
+#    element and text node while it is built.
 
 class TreeBuilder:
 
-    def __init__(self, element_factory=None):
+    def __init__(self, element_factory=None, skip=None, keep=None, intern=None,
+                 chunk_text=None, spill_text=None, validator=None):
         self._data = [] # data collector
         self._elem = [] # element stack
         self._last = None # last element
         if element_factory is None:
             element_factory = Element
         self._factory = element_factory
+        if skip is not None and not callable(skip):
+            skip_tags = frozenset(skip)
+            skip = lambda tag, attrib: tag in skip_tags
+        self._skip = skip
+        if keep is not None:
+            if isinstance(keep, str):
+                raise ValueError("keep needs a sequence of paths, not a single path")
+            keep = [_keep_path(path) for path in keep]
+        self._keep = keep
+        self._keep_state = [] # keep state stack
+        self._discard = 0 # depth inside a discarded subtree
+        self._drop_text = False
+        if intern is True:
+            intern = Interner()
+        elif intern is False:
+            intern = None
+        self._intern = intern
+        if chunk_text is None:
+            chunk_text = spill_text
+        self._chunk_text = chunk_text
+        self._spill_text = spill_text
+        self._data_size = 0
+        self._chunked = None # ChunkedText collecting the current text
+        self._validator = validator
+        # XMLParser may bypass the builder methods if nothing is filtered
+        # and text is always joined
+        self._simple = skip is None and keep is None and chunk_text is None
 
     ##
     # Flushes the builder buffers, and returns the toplevel document
@@ -911,15 +1246,26 @@ class TreeBuilder:
         return self._last
 
     def _flush(self):
-        if self._data:
+        if self._chunked is not None:
+            if self._validator is not None:
+                self._validator.text(self._elem[-1].tag, self._chunked)
+            self._elem[-1].append(self._chunked)
+            self._chunked = None
+        elif self._data:
             text = "".join(self._data)
+            if self._intern is not None:
+                text = self._intern(text)
             if self._elem:
+                if self._validator is not None:
+                    self._validator.text(self._elem[-1].tag, text)
                 self._elem[-1].append(text)
             else:
                 # ignore empty lines in input, typically strings like: "\n", "   \n", "\n\n\n", etc.
                 text = text.strip()
                 assert not text, 'Parsing error: cannot append orphan string to prior node.'
-            self._data = []
+            # clear in place, XMLParser may hold a reference to the list
+            del self._data[:]
+        self._data_size = 0
 
     ##
     # Adds text to the current element.
@@ -928,7 +1274,18 @@ class TreeBuilder:
     #    containing ASCII text, or a Unicode string.
 
     def data(self, data):
-        self._data.append(data)
+        if self._drop_text:
+            return
+        if self._chunk_text is None:
+            self._data.append(data)
+        elif self._chunked is not None:
+            self._chunked.append(data)
+        else:
+            self._data.append(data)
+            self._data_size += len(data)
+            if self._data_size > self._chunk_text and self._elem:
+                self._chunked = ChunkedText(self._data, spill=self._spill_text)
+                del self._data[:]
 
     ##
     # Opens a new element.
@@ -939,13 +1296,79 @@ class TreeBuilder:
     # @defreturn Element
 
     def start(self, tag, attrs):
+        if not self._simple and not self._filter_start(tag, attrs):
+            return None
         self._flush()
+        if self._validator is not None:
+            self._validator.start(tag, attrs, self._elem[-1].tag if self._elem else None)
+        if self._intern is not None and attrs:
+            intern = self._intern
+            for key, value in attrs.items():
+                attrs[key] = intern(value)
         self._last = elem = self._factory(tag, attrs)
         if self._elem:
             self._elem[-1].append(elem)
         self._elem.append(elem)
         return elem
 
+    def _filter_start(self, tag, attrs):
+        # decide if an element is built, or discarded with its content
+        if self._discard:
+            self._discard += 1
+            return False
+        if self._skip is not None and self._skip(tag, attrs):
+            self._discard_start()
+            return False
+        if self._keep is not None:
+            state = self._keep_match(tag)
+            if state is False:
+                self._discard_start()
+                return False
+            self._keep_state.append(state)
+            # only text inside of kept subtrees is preserved
+            self._drop_text = state is not None
+        return True
+
+    def _discard_start(self):
+        self._flush()
+        self._discard = 1
+        self._drop_text = True
+
+    def _keep_match(self, tag):
+        # returns None if the element and everything below is kept, a
+        # list of the partially matching paths if only the element is
+        # kept, and False if it is discarded
+        if not self._elem:
+            return self._keep
+        state = self._keep_state[-1]
+        if state is None:
+            return None
+        index = len(self._elem) - 1
+        matches = [path for path in state if path[index] in ("*", tag)]
+        if not matches:
+            return False
+        for path in matches:
+            if len(path) == index + 1:
+                return None
+        return matches
+
+    def _filter_end(self):
+        # returns True if the closed element was built
+        if self._discard:
+            self._discard -= 1
+            if not self._discard:
+                self._drop_text = bool(self._keep_state) and self._keep_state[-1] is not None
+            return False
+        if self._keep is not None:
+            state = self._keep_state.pop()
+            self._drop_text = bool(self._keep_state) and self._keep_state[-1] is not None
+            if state is not None and len(self._elem) > 1 and not len(self._elem[-1]):
+                # nothing matched below this ancestor, drop it again
+                self._elem.pop()
+                del self._elem[-1][-1]
+                return False
+        return True
+
     ##
     # Closes the current element.
     #
@@ -954,6 +1377,8 @@ class TreeBuilder:
     # @defreturn Element
 
     def end(self, tag):
+        if not self._simple and not self._filter_end():
+            return None
         self._flush()
         self._last = self._elem.pop()
         assert self._last.tag == tag,\
@@ -961,6 +1386,381 @@ class TreeBuilder:
                    self._last.tag, tag)
         return self._last
 
+##
+# Bounded table of strings.  Equal strings passed through it are replaced
+# by a single shared instance, which lowers the memory used by trees with
+# many repeated attribute values or text nodes.  Once the table is full,
+# unknown strings are passed through unchanged.
+# <p>
+# The same instance can be shared by several builders, for example to
+# share the values of all trees kept in a cache.
+#
+# @keyparam max_entries Maximum number of strings in the table.
+# @keyparam max_length Longer strings are never interned.
+
+class Interner:
+
+    def __init__(self, max_entries=65536, max_length=256):
+        self.max_entries = max_entries
+        self.max_length = max_length
+        self.hits = 0 # strings replaced by the shared instance
+        self.saved = 0 # estimated bytes saved by the replacements
+        self._table = {}
+
+    def __len__(self):
+        return len(self._table)
+
+    def __call__(self, value):
+        if len(value) > self.max_length:
+            return value
+        table = self._table
+        shared = table.get(value)
+        if shared is None:
+            if len(table) < self.max_entries:
+                table[value] = value
+            return value
+        if shared is not value:
+            self.hits += 1
+            self.saved += sys.getsizeof(value)
+        return shared
+
+    ##
+    # Returns a dictionary with the number of entries, the number of
+    # replaced strings and the estimated number of bytes saved.
+
+    def stats(self):
+        return {
+            "entries": len(self._table),
+            "hits": self.hits,
+            "saved": self.saved,
+        }
+
+def _split_path(path):
+    # split a path into its steps, keeping "{uri}name" tags intact
+    if isinstance(path, str):
+        return tuple(_path_step_re.findall(path))
+    return tuple(path)
+
+_path_step_re = re.compile(r"\{[^}]*\}[^/]*|[^/]+")
+
+def _keep_path(path):
+    # a keep path split into its steps; empty steps are not silently
+    # dropped, "b//c" or "/b" most likely mean something else
+    steps = _split_path(path)
+    if not steps or not all(steps) or (isinstance(path, str) and "/".join(steps) != path):
+        raise ValueError("invalid keep path %r" % (path, ))
+    return steps
+
+##
+# Resource limits for parsing untrusted documents.  A document exceeding
+# one of the limits is rejected with a {@link #ParseLimitError} as soon
+# as the limit is hit.  Limits set to None are not checked.
+#
+# @keyparam max_depth Maximum nesting depth of elements.
+# @keyparam max_elements Maximum number of elements.
+# @keyparam max_attributes Maximum number of attributes per element.
+# @keyparam max_text Maximum number of characters of character data.
+# @keyparam max_entity_expansions Maximum number of entity references
+#     resolved in the whole document, in content and attribute values,
+#     counting references nested in entity values.
+
+class ParseLimits:
+
+    def __init__(self, max_depth=None, max_elements=None, max_attributes=None,
+                 max_text=None, max_entity_expansions=None):
+        self.max_depth = max_depth
+        self.max_elements = max_elements
+        self.max_attributes = max_attributes
+        self.max_text = max_text
+        self.max_entity_expansions = max_entity_expansions
+
+    ##
+    # Creates the counters for a single document.
+
+    def guard(self):
+        return _LimitGuard(self)
+
+##
+# Compiled content model.  The model declares for every tag the permitted
+# children, the permitted and required attributes, and if non-whitespace
+# text is allowed.  It is compiled to lookup tables, so checking an
+# element costs a few set lookups.  It is used as validator option of the
+# {@link #TreeBuilder}, checking the elements while they are built, or
+# checks an existing tree with {@link #ContentModel.validate}.
+# <p>
+# The declaration maps each tag to a dictionary with the optional keys
+# "children" (permitted child tags, None for any, default none),
+# "attributes" (permitted attribute names, None for any, default none),
+# "required" (required attribute names) and "text" (default True).
+#
+# @param declaration Dictionary of tag declarations.
+# @keyparam root Optional permitted tags of the root element.
+# @keyparam strict Reject tags not declared.  If false, undeclared tags
+#     may have any content, if their parent permits them.
+# @keyparam namespace Optional namespace URI of the tags given without a
+#     "{uri}" prefix.
+# @keyparam attribute_namespace Optional namespace URI of the attribute
+#     names given without a "{uri}" prefix.
+
+class ContentModel:
+
+    def __init__(self, declaration, root=None, strict=True, namespace=None,
+                 attribute_namespace=None):
+        def tag_name(tag):
+            return _qualify(tag, namespace)
+
+        def tag_set(tags):
+            if tags is None:
+                return None
+            return frozenset(tag_name(tag) for tag in tags)
+
+        def attribute_set(names):
+            if names is None:
+                return None
+            return frozenset(_qualify(name, attribute_namespace) for name in names)
+
+        self._children = {}
+        self._attributes = {}
+        self._required = {}
+        self._no_text = set()
+        for tag, decl in declaration.items():
+            tag = tag_name(tag)
+            self._children[tag] = tag_set(decl.get("children", ()))
+            self._attributes[tag] = attribute_set(decl.get("attributes", ()))
+            required = attribute_set(decl.get("required", ()))
+            if required:
+                self._required[tag] = required
+            if not decl.get("text", True):
+                self._no_text.add(tag)
+        self._root = tag_set(root)
+        self._strict = strict
+
+    ##
+    # Checks an element when it is started.
+    #
+    # @param tag The element tag.
+    # @param attrib The attribute dictionary.
+    # @param parent The tag of the parent element, None for the root.
+    # @exception ValidationError If the element is not permitted.
+
+    def start(self, tag, attrib, parent):
+        if parent is None:
+            if self._root is not None and tag not in self._root:
+                raise ValidationError("root element %s not permitted" % tag, tag)
+        else:
+            permitted = self._children.get(parent)
+            if permitted is not None and tag not in permitted:
+                raise ValidationError("element %s not permitted in %s" % (tag, parent), tag)
+        if tag not in self._children:
+            if self._strict:
+                raise ValidationError("element %s not declared" % tag, tag)
+            return
+        permitted = self._attributes[tag]
+        if attrib:
+            if permitted is not None:
+                for key in attrib:
+                    if key not in permitted:
+                        raise ValidationError("attribute %s not permitted in %s" % (key, tag), tag)
+        required = self._required.get(tag)
+        if required is not None:
+            for key in required:
+                if key not in attrib:
+                    raise ValidationError("attribute %s required in %s" % (key, tag), tag)
+
+    ##
+    # Checks text content of an element.
+    #
+    # @param tag The element tag.
+    # @param text A string or {@link #ChunkedText}.
+    # @exception ValidationError If the element does not permit text.
+
+    def text(self, tag, text):
+        if tag in self._no_text:
+            if isinstance(text, str):
+                blank = text.isspace()
+            else:
+                blank = all(chunk.isspace() for chunk in text)
+            if not blank:
+                raise ValidationError("text not permitted in %s" % tag, tag)
+
+    ##
+    # Returns the violations of the model in an element tree, in document
+    # order, in one pass over the tree.
+    #
+    # @param elem An element.
+    # @return A list of {@link #ValidationError} instances.
+
+    def errors(self, elem):
+        errors = []
+        work = [(elem, None)]
+        while work:
+            elem, parent = work.pop()
+            tag = elem.tag
+            try:
+                self.start(tag, elem.attrib, parent)
+            except ValidationError as err:
+                errors.append(err)
+            for child in elem:
+                if not isinstance(child, (Element, Comment, ProcessingInstruction)):
+                    try:
+                        self.text(tag, child)
+                    except ValidationError as err:
+                        errors.append(err)
+                        break
+            work.extend((child, tag) for child in reversed(list(elem.iter_elements())))
+        return errors
+
+    ##
+    # Checks an element tree.
+    #
+    # @param elem An element.
+    # @exception ValidationError The first violation in document order.
+
+    def validate(self, elem):
+        errors = self.errors(elem)
+        if errors:
+            raise errors[0]
+
+def _qualify(name, uri):
+    if uri is None or name[:1] == "{":
+        return name
+    return "{%s}%s" % (uri, name)
+
+class _LimitGuard:
+    # per document counters for ParseLimits
+
+    def __init__(self, limits):
+        def limit(value):
+            return sys.maxsize if value is None else value
+        self.max_depth = limit(limits.max_depth)
+        self.max_elements = limit(limits.max_elements)
+        self.max_attributes = limit(limits.max_attributes)
+        self.max_text = limit(limits.max_text)
+        self.max_entity_expansions = limit(limits.max_entity_expansions)
+        self.depth = 0
+        self.elements = 0
+        self.text = 0
+        self.expansions = 0
+
+    def start(self, depth, attributes):
+        if depth > self.max_depth:
+            raise ParseLimitError("maximum depth of %d exceeded" % self.max_depth, "max_depth")
+        self.elements += 1
+        if self.elements > self.max_elements:
+            raise ParseLimitError("maximum number of %d elements exceeded" % self.max_elements, "max_elements")
+        if attributes > self.max_attributes:
+            raise ParseLimitError("maximum number of %d attributes exceeded" % self.max_attributes, "max_attributes")
+
+    def data(self, size):
+        self.text += size
+        if self.text > self.max_text:
+            raise ParseLimitError("maximum text size of %d exceeded" % self.max_text, "max_text")
+
+    def expand(self, count):
+        self.expansions += count
+        if self.expansions > self.max_entity_expansions:
+            raise ParseLimitError("maximum number of %d entity expansions exceeded" % self.max_entity_expansions,
+                                  "max_entity_expansions")
+
+_entity_ref_re = re.compile(r"&([^&;#\s]+);")
+
+_start_tag_re = re.compile(r"""<[^\s/>]+(?:\s+[^\s=/>]+\s*=\s*(?:"[^"]*"|'[^']*'))*\s*/?>""")
+
+_predefined_entities = {"lt": "<", "gt": ">", "amp": "&", "quot": "\"", "apos": "'"}
+
+##
+# Bulk build mode.  Suspends the cyclic garbage collector while a large
+# tree is built: nothing in a growing tree is garbage, but every
+# collection traverses it again.  The collector is global, so this affects
+# all threads until the build is finished.
+# <p>
+# Use it as context manager around the build, or pass it as bulk option to
+# {@link #XMLParser} or html.HTMLParser, which suspend the collector from
+# the first feed until close, or until a parse error.
+# <p>
+# The collections that still ran and their pause time are recorded.  With
+# disable set to False, the collector stays enabled and only the
+# statistics are collected, for comparison with a bulk build.
+#
+# @keyparam freeze Move all objects tracked by the collector, including
+#     the new tree, to the permanent generation after a successful build
+#     (gc.freeze).  Useful for long-lived, cached trees.
+# @keyparam disable Suspend the collector during the build.
+
+class BulkBuild:
+
+    def __init__(self, freeze=False, disable=True):
+        self.freeze = freeze
+        self.disable = disable
+        self.active = False
+        self.collections = [0, 0, 0] # by generation
+        self.pause = 0.0 # seconds spent in collections
+        self._enabled = None
+        self._started = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop(success=exc_type is None)
+
+    ##
+    # Starts the build mode, if it is not already active.
+
+    def start(self):
+        if self.active:
+            return
+        self.active = True
+        self._enabled = gc.isenabled()
+        if self.disable:
+            gc.disable()
+        gc.callbacks.append(self._callback)
+
+    ##
+    # Ends the build mode, if it is active, and restores the collector.
+    #
+    # @keyparam success If false, the result is not frozen.
+
+    def stop(self, success=True):
+        if not self.active:
+            return
+        self.active = False
+        gc.callbacks.remove(self._callback)
+        if self._enabled:
+            gc.enable()
+        if self.freeze and success:
+            gc.freeze()
+
+    def _callback(self, phase, info):
+        if phase == "start":
+            from time import perf_counter
+            self._started = perf_counter()
+        elif self._started is not None:
+            from time import perf_counter
+            self.pause += perf_counter() - self._started
+            self.collections[info["generation"]] += 1
+            self._started = None
+
+    ##
+    # Returns a dictionary with the number of collections by generation,
+    # their total pause time in seconds, and the number of objects in the
+    # permanent generation.
+
+    def stats(self):
+        return {
+            "collections": tuple(self.collections),
+            "pause": self.pause,
+            "frozen": gc.get_freeze_count(),
+        }
+
+def _bulk_build(bulk):
+    if bulk is True:
+        return BulkBuild()
+    elif bulk is False:
+        return None
+    return bulk
+
 ##
 # Element structure builder for XML source data, based on the
 # <b>expat</b> parser.
@@ -971,12 +1771,18 @@ class TreeBuilder:
 #     by the current implementation.
 # @keyparam encoding Optional encoding.  If given, the value overrides
 #     the encoding specified in the XML file.
+# @keyparam limits Optional {@link #ParseLimits} instance.  If the
+#     entity expansions are limited, references to entities declared in
+#     the document type are resolved by the parser instead of expat, and
+#     entities containing markup are rejected.
+# @keyparam bulk Optional {@link #BulkBuild} instance, or True to use a
+#     new one, suspending the garbage collector while parsing.
 # @see #ElementTree
 # @see #TreeBuilder
 
 class XMLParser:
 
-    def __init__(self, html=0, target=None, encoding=None):
+    def __init__(self, html=0, target=None, encoding=None, limits=None, bulk=None):
         try:
             from xml.parsers import expat
         except ImportError:
@@ -1008,8 +1814,16 @@ class XMLParser:
             parser.StartElementHandler = self._start_list
         except AttributeError:
             pass
+        else:
+            if target.__class__ is TreeBuilder and target._simple:
+                self._setup_builder(parser, target)
+        self._guard = None
+        self._entities = {} # internal entities: name -> (value, cost)
+        if limits is not None:
+            self._setup_limits(parser, limits)
         self._doctype = None
         self.entity = {}
+        self.bulk = _bulk_build(bulk)
         try:
             self.version = "Expat %d.%d.%d" % expat.version_info
         except AttributeError:
@@ -1021,6 +1835,10 @@ class XMLParser:
         err.position = value.lineno, value.offset
         raise err
 
+    def _locate(self, err):
+        if getattr(err, "position", None) is None:
+            err.position = self._parser.CurrentLineNumber, self._parser.CurrentColumnNumber
+
     def _fixname(self, key):
         # expand qname, and convert name string to ascii, if possible
         if key in self._names:
@@ -1033,6 +1851,156 @@ class XMLParser:
         self._names[key] = name
         return name
 
+    def _setup_builder(self, parser, target):
+        # Fast path for the stock TreeBuilder: build the element structure
+        # directly inside the expat callbacks, instead of dispatching
+        # every event through _start_list/_end/_data and the target
+        # methods.  The builder state is shared, so the generic handlers
+        # (as used by iterparse and _default) can still be mixed in.
+        names = self._names
+        fixname = self._fixname
+        factory = target._factory
+        stack = target._elem
+        push = stack.append
+        data = target._data
+        flush = target._flush
+        intern = target._intern
+        validate = target._validator.start if target._validator is not None else None
+        new = Element.__new__ if factory is Element else None
+
+        def start(tag, attrib_in):
+            if data:
+                flush()
+            try:
+                tag = names[tag]
+            except KeyError:
+                tag = fixname(tag)
+            attrib = {}
+            if attrib_in:
+                for i in range(0, len(attrib_in), 2):
+                    key = attrib_in[i]
+                    try:
+                        key = names[key]
+                    except KeyError:
+                        key = fixname(key)
+                    value = attrib_in[i + 1]
+                    attrib[key] = value if intern is None else intern(value)
+            if validate is not None:
+                validate(tag, attrib, stack[-1].tag if stack else None)
+            if new is not None:
+                # the attribute dict is ours, no need to copy it again
+                elem = new(Element)
+                elem.tag = tag
+                elem.attrib = attrib
+                elem._children = []
+            else:
+                elem = factory(tag, attrib)
+            if stack:
+                stack[-1].append(elem)
+            push(elem)
+            target._last = elem
+
+        def end(tag):
+            # expat already checks that start and end tags match
+            if data:
+                flush()
+            target._last = stack.pop()
+
+        parser.StartElementHandler = start
+        parser.EndElementHandler = end
+        parser.CharacterDataHandler = data.append
+
+    def _setup_limits(self, parser, limits):
+        # check the limits before passing the events to the real handlers
+        self._guard = guard = limits.guard()
+        guard_start = guard.start
+        guard_data = guard.data
+        start = parser.StartElementHandler
+        end = parser.EndElementHandler
+        data = parser.CharacterDataHandler
+        attrib_step = 2 if parser.ordered_attributes else 1
+
+        def guarded_start(tag, attrib_in):
+            guard.depth += 1
+            guard_start(guard.depth, len(attrib_in) // attrib_step)
+            if attrib_in and self._entities:
+                # expat already expanded the references in the values
+                guard.expand(self._attribute_expansions(parser.GetInputContext()))
+            start(tag, attrib_in)
+
+        def guarded_end(tag):
+            guard.depth -= 1
+            end(tag)
+
+        def guarded_data(text):
+            guard_data(len(text))
+            data(text)
+
+        parser.StartElementHandler = guarded_start
+        parser.EndElementHandler = guarded_end
+        parser.CharacterDataHandler = guarded_data
+        if limits.max_entity_expansions is not None:
+            # keep expat from expanding internal entities in content, so
+            # the references end up in _default and can be counted
+            parser.DefaultHandlerExpand = None
+            parser.DefaultHandler = self._default
+            parser.EntityDeclHandler = self._entity_decl
+
+    def _entity_decl(self, name, is_parameter, value, base, system_id, public_id, notation):
+        if is_parameter or value is None:
+            return
+        # the cost of a reference includes all nested references
+        cost = 1
+        for ref in _entity_ref_re.findall(value):
+            if ref in self._entities:
+                cost += self._entities[ref][1]
+            elif ref not in _predefined_entities:
+                cost += 1
+        if cost > self._guard.max_entity_expansions:
+            raise ParseLimitError("entity %s exceeds the maximum number of %d entity expansions" %
+                                  (name, self._guard.max_entity_expansions), "max_entity_expansions")
+        self._entities[name] = value, cost
+
+    def _attribute_expansions(self, context):
+        # the cost of the entity references in the raw start tag at the
+        # beginning of context
+        if context[:2] in (b"<\0", b"\0<"):
+            context = context.decode("utf-16-le" if context[:1] == b"<" else "utf-16-be", "ignore")
+        else:
+            # references are ascii, other bytes never match
+            context = context.decode("latin-1")
+        match = _start_tag_re.match(context)
+        if match is None:
+            return 0
+        cost = 0
+        for ref in _entity_ref_re.findall(match.group()):
+            if ref in self._entities:
+                cost += self._entities[ref][1]
+            elif ref not in _predefined_entities:
+                cost += 1
+        return cost
+
+    def _expand_entity(self, name, active=()):
+        # resolve an internal entity, counting every reference on the way
+        if name in active:
+            raise ParseError("recursive entity reference %s" % name)
+        self._guard.expand(1)
+        value = self._entities[name][0]
+        if "<" in value:
+            raise ParseError("markup in entity %s is not supported" % name)
+        active += (name, )
+
+        def replace(match):
+            ref = match.group(1)
+            if ref in _predefined_entities:
+                return _predefined_entities[ref]
+            if ref in self._entities:
+                return self._expand_entity(ref, active)
+            self._guard.expand(1)
+            return self.entity[ref]
+
+        return _entity_ref_re.sub(replace, value)
+
     def _start(self, tag, attrib_in):
         fixname = self._fixname
         tag = fixname(tag)
@@ -1060,8 +2028,14 @@ class XMLParser:
         prefix = text[:1]
         if prefix == "&":
             # deal with undefined entities
+            name = text[1:-1]
             try:
-                self.target.data(self.entity[text[1:-1]])
+                if name in self._entities:
+                    value = self._expand_entity(name)
+                else:
+                    value = self.entity[name]
+                    if self._guard is not None:
+                        self._guard.expand(1)
             except KeyError:
                 from xml.parsers import expat
                 err = expat.error(
@@ -1073,6 +2047,7 @@ class XMLParser:
                 err.lineno = self._parser.ErrorLineNumber
                 err.offset = self._parser.ErrorColumnNumber
                 raise err
+            self._parser.CharacterDataHandler(value)
         elif prefix == "<" and text[:9] == "<!DOCTYPE":
             self._doctype = [] # inside a doctype declaration
         elif self._doctype is not None:
@@ -1106,10 +2081,43 @@ class XMLParser:
     # @param data Encoded data.
 
     def feed(self, data):
+        if self.bulk is not None:
+            self.bulk.start()
         try:
-            self._parser.Parse(data, 0)
-        except self._error as v:
-            self._raiseerror(v)
+            try:
+                self._parser.Parse(data, 0)
+            except self._error as v:
+                self._raiseerror(v)
+            except ParseError as err:
+                # raised by a handler, e.g. for exceeded limits
+                self._locate(err)
+                raise
+        except BaseException:
+            if self.bulk is not None:
+                self.bulk.stop(success=False)
+            raise
+
+    ##
+    # Feeds data to the parser in steps.  This is a generator, each step
+    # parses one block of data, so other work can be done between the
+    # steps.  With max_time, blocks are parsed until the time is used up.
+    #
+    # @param data Encoded data.
+    # @keyparam max_bytes Block size (default is 16384).
+    # @keyparam max_time Optional time per step in seconds.
+
+    def feed_steps(self, data, max_bytes=None, max_time=None):
+        size = max_bytes or 16384
+        if max_time is not None:
+            from time import perf_counter
+            start = perf_counter()
+        for pos in range(0, len(data), size):
+            self.feed(data[pos:pos + size])
+            if max_time is None:
+                yield
+            elif perf_counter() - start >= max_time:
+                yield
+                start = perf_counter()
 
     ##
     # Finishes feeding data to the parser.
@@ -1119,96 +2127,250 @@ class XMLParser:
 
     def close(self):
         try:
-            self._parser.Parse("", 1) # end of data
-        except self._error as v:
-            self._raiseerror(v)
-        tree = self.target.close()
+            try:
+                self._parser.Parse("", 1) # end of data
+            except self._error as v:
+                self._raiseerror(v)
+            except ParseError as err:
+                self._locate(err)
+                raise
+            tree = self.target.close()
+        except BaseException:
+            if self.bulk is not None:
+                self.bulk.stop(success=False)
+            raise
+        if self.bulk is not None:
+            self.bulk.stop()
         del self.target, self._parser # get rid of circular references
         return tree
 
-class BaseWriter:
-    def __init__(self, encoding=None, namespaces={}):
-        self.encoding = encoding
-        self.namespaces = namespaces
+def _escape_cdata(text):
+    # escape character data
+    # it's worth avoiding do-nothing calls for strings that are
+    # shorter than 500 character, or so.  assume that's, by far,
+    # the most common case in most applications.  the "in" tests are
+    # plain memory scans and beat a single regular expression or
+    # str.translate pass for text without special characters.
+    if "&" in text:
+        text = text.replace("&", "&amp;")
+    if "<" in text:
+        text = text.replace("<", "&lt;")
+    if ">" in text:
+        text = text.replace(">", "&gt;")
+    return text
+
+def _escape_attrib(text):
+    # escape attribute value
+    if "&" in text:
+        text = text.replace("&", "&amp;")
+    if "<" in text:
+        text = text.replace("<", "&lt;")
+    if ">" in text:
+        text = text.replace(">", "&gt;")
+    if "\"" in text:
+        text = text.replace("\"", "&quot;")
+    if "\n" in text:
+        text = text.replace("\n", "&#10;")
+    return text
+
+# escaped attribute values.  class names, link targets and the like
+# repeat throughout a document, so short values are escaped once.  the
+# cache is shared by all writers; it is cleared when full.
+_escape_attrib_cache = {}
+_escape_attrib_cache_size = 4096
+_escape_attrib_cache_length = 100
+
+def _escape_attrib_cached(text, _get=_escape_attrib_cache.get):
+    result = _get(text)
+    if result is None:
+        result = _escape_attrib(text)
+        if len(text) <= _escape_attrib_cache_length and text.__class__ is str:
+            if len(_escape_attrib_cache) >= _escape_attrib_cache_size:
+                _escape_attrib_cache.clear()
+            _escape_attrib_cache[text] = result
+    return result
 
-    def _escape_cdata(self, text):
-        # escape character data
-        # it's worth avoiding do-nothing calls for strings that are
-        # shorter than 500 character, or so.  assume that's, by far,
-        # the most common case in most applications.
-        if "&" in text:
-            text = text.replace("&", "&amp;")
-        if "<" in text:
-            text = text.replace("<", "&lt;")
-        if ">" in text:
-            text = text.replace(">", "&gt;")
-        return text
+##
+# Buffer between a writer and its output.  The writers produce many small
+# strings; the sink collects them and passes them on in blocks of at
+# least flush_size characters, encoded in one go if an encoding is given.
+# This saves a call to the output and to the encoder per string.
+# <p>
+# Use the write method as write function of the writers, and call the
+# flush method with final set after the last write; it is also called
+# when the sink is used as context manager.  The writers use a sink for all encoded output,
+# with their own encoding.  If the write function passed to them belongs
+# to a sink, they use that one, with its target, flush size and encoding.
+#
+# @param target A file or socket object, or a write function.  Files and
+#     io.BufferedWriter use write, sockets use sendall.
+# @keyparam encoding Output encoding, None passes the text on unencoded.
+#     Characters not in the encoding are written as character references.
+# @keyparam flush_size Number of characters collected before writing.
+
+class BufferedSink:
+
+    def __init__(self, target, encoding=None, flush_size=65536):
+        if hasattr(target, "write"):
+            target = target.write
+        elif hasattr(target, "sendall"):
+            target = target.sendall
+        self.encoding = encoding
+        self.flush_size = flush_size
+        encode = _encoder(encoding) if encoding else None
+        parts = []
+        append = parts.append
+        size = 0
+
+        # write and flush are closures over the buffer: write is called for
+        # every string and a closure saves the attribute lookups of a method
+
+        def write(text):
+            nonlocal size
+            append(text)
+            size += len(text)
+            if size >= flush_size:
+                flush()
+
+        def flush(final=False):
+            nonlocal size
+            if not parts and not final:
+                return
+            text = "".join(parts)
+            parts.clear()
+            size = 0
+            if encode is not None:
+                text = encode(text, final)
+                if not text:
+                    return
+            target(text)
 
-    def _escape_attrib(self, text):
-        # escape attribute value
-        if "\"" in text:
-            text = text.replace("\"", "&quot;")
-        if "\n" in text:
-            text = text.replace("\n", "&#10;")
-        return self._escape_cdata(text)
+        write.sink = self
+        self.write = write
+        self.flush = flush
 
-    def _namespaces(self, elem):
-        # identify namespaces used in this tree
+    def __enter__(self):
+        return self
 
-        # maps qnames to *encoded* prefix:local names
-        qnames = {None: None}
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.flush(final=True)
+
+def _encode_utf8(text, final=False):
+    # utf-8 represents every character, but lone surrogates
+    return text.encode("utf-8", "xmlcharrefreplace")
+
+def _encode_ascii(text, final=False):
+    # the ascii check is a flag of the string and takes no scan
+    if text.isascii():
+        return text.encode("ascii")
+    return text.encode("ascii", "xmlcharrefreplace")
+
+def _encode_latin1(text, final=False):
+    return text.encode("latin-1", "xmlcharrefreplace")
+
+_encoders = {
+    "utf-8": _encode_utf8,
+    "ascii": _encode_ascii,
+    "iso8859-1": _encode_latin1,
+}
+
+def _encoder(encoding):
+    # returns a function encoding a block of text, with character
+    # references for characters not in the encoding.  Encodings writing a
+    # BOM get an incremental encoder, so it is written only once; all
+    # others are encoded by str.encode, which handles xmlcharrefreplace
+    # without calling back into Python.  Shift encodings, like iso-2022,
+    # return to the initial state at the end of every block, which is
+    # valid output.
+    name = codecs.lookup(encoding).name
+    encode = _encoders.get(name)
+    if encode is None:
+        if "a".encode(name) * 2 == "aa".encode(name):
+            def encode(text, final=False):
+                return text.encode(name, "xmlcharrefreplace")
+        else:
+            encode = codecs.getincrementalencoder(name)("xmlcharrefreplace").encode
+    return encode
 
-        # maps uri:s to prefixes
-        candidate_namespaces = self._namespace_map.copy()
-        candidate_namespaces = {}
-        candidate_namespaces.update(self.namespaces)
-        used_namespaces = {}
+class BaseWriter:
+    """
+    Base class of the writers.
+
+    A writer keeps no state of a single write call, so an instance can be
+    reused for any number of calls, also from several threads.  It caches
+    the sorted attribute orders over all calls.
+
+    @param encoding: output encoding, None writes str
+    @param namespaces: preferred prefixes as uri -> prefix dict
+    @param sort_attributes: write attributes sorted by name; False keeps
+        their insertion order
+    @param fragments: cache.FragmentCache for the output of subtrees, used
+        by all write methods
+    """
 
-        def add_qname(qname):
-            if qname in qnames:
-                return
+    # maximum number of cached attribute orders
+    attribute_orders_size = 1024
+    # block size of encoded output, see BufferedSink
+    flush_size = 65536
 
-            # calculate serialized qname representation
-            try:
-                if qname.uri is not None:
-                    uri = qname.uri
-                    prefix = used_namespaces.get(uri, None)
-                    if prefix is None:
-                        prefix = candidate_namespaces.get(uri, None)
-                        if prefix is None:
-                            prefix = "ns%d" % len(used_namespaces)
-                        if prefix != "xml":
-                            used_namespaces[uri] = prefix
-                    if prefix:
-                        qnames[qname] = "{}:{}".format(prefix, qname.name)
-                    else:
-                        qnames[qname] = qname.name
-                else:
-                    # XXX: What happens with undefined namespace?
-                    qnames[qname] = qname.name
-            except TypeError:
-                self._raise_serialization_error(qname)
-
-        # populate qname and namespaces table
-        if elem.__class__ is Element:
-            for elem in elem.iter_elements_tree():
-                tag = elem.tag
-                if isinstance(tag, QName):
-                    add_qname(tag)
-                elif isinstance(tag, str):
-                    add_qname(QName(tag))
-                elif tag is not None:
-                    self._raise_serialization_error(tag)
-
-                for key in elem.attrib:
-                    if isinstance(key, QName):
-                        add_qname(key)
-                    elif isinstance(key, str):
-                        add_qname(QName(key))
-                    elif key is not None:
-                        self._raise_serialization_error(key)
-
-        return qnames, used_namespaces
+    def __init__(self, encoding=None, namespaces={}, sort_attributes=True, fragments=None):
+        self.encoding = encoding
+        self.namespaces = namespaces
+        self.sort_attributes = sort_attributes
+        self.fragments = fragments
+        self._orders = {} # attribute keys -> sorted keys
+
+    def _attribute_order(self, keys):
+        # returns the attribute keys in the order they are written
+        if not self.sort_attributes:
+            return keys
+        order = self._orders.get(keys)
+        if order is None:
+            order = tuple(sorted(keys))
+            if len(self._orders) >= self.attribute_orders_size:
+                self._orders.clear()
+            self._orders[keys] = order
+        return order
+
+    _escape_cdata = staticmethod(_escape_cdata)
+    _escape_attrib = staticmethod(_escape_attrib_cached)
+
+    def _declarations(self, elem, qnames, namespaces):
+        # returns the namespaces used by an element, which are not declared
+        # by an ancestor yet, as uri -> prefix dict or None.  Namespaces
+        # are declared on the first element using them, so no separate
+        # pass over the tree is needed.
+        tag = elem.tag
+        if tag is None:
+            # not written, the children declare what they need
+            return None
+        if tag not in qnames:
+            qnames[tag]
+        uris = qnames.uris
+        uri = uris.get(tag)
+        if uri is not None and uri not in namespaces:
+            declare = {uri: qnames.prefixes[uri]}
+        else:
+            declare = None
+        attrib = elem.attrib
+        if attrib:
+            for key, value in attrib.items():
+                if key not in qnames:
+                    qnames[key]
+                uri = uris.get(key)
+                if uri is not None and uri not in namespaces:
+                    if declare is None:
+                        declare = {}
+                    declare[uri] = qnames.prefixes[uri]
+                if value.__class__ is QName:
+                    qnames[value]
+                    uri = uris.get(value)
+                    if uri is not None and uri not in namespaces:
+                        if declare is None:
+                            declare = {}
+                        declare[uri] = qnames.prefixes[uri]
+        return declare
 
     @staticmethod
     def _raise_serialization_error(text):
@@ -1256,18 +2418,166 @@ class BaseWriter:
     def serialize(self, write, elem, qnames, namespaces={}):
         raise NotImplementedError
 
+    def _serialize_steps(self, write, elem, qnames, namespaces):
+        # serializes like serialize, yields after every node
+        self.serialize(write, elem, qnames, namespaces)
+        yield
+
+    def _sink(self, write):
+        # returns the sink for the output of a write call, or None if the
+        # output is not encoded.  A sink passed in is used with its own
+        # encoding.
+        sink = getattr(write, "sink", None)
+        if isinstance(sink, BufferedSink):
+            return sink
+        if self.encoding:
+            return BufferedSink(write, self.encoding, self.flush_size)
+        return None
+
     def write(self, write, element, document=False):
-        qnames, namespaces = self._namespaces(element)
+        sink = self._sink(write)
+        if sink is not None:
+            write = sink.write
 
-        if self.encoding:
-            def write_encode(text):
-                write(text.encode(self.encoding, "xmlcharrefreplace"))
-        else:
-            write_encode = write
+        if document:
+            self.serialize_document_start(write)
+        self.serialize(write, element, _QNames(self), {})
+        if sink is not None:
+            sink.flush(final=True)
+
+    def write_steps(self, write, element, document=False, max_nodes=None, max_time=None):
+        """
+        Writes an element like write, in steps.
+
+        This is a generator, every step does the work for at most max_nodes
+        nodes or max_time seconds, which lets a scheduler interleave the
+        serialization of a large tree with other work.  Without limits,
+        every node is a step.
+
+        @param max_nodes: maximum number of nodes per step
+        @param max_time: maximum time per step in seconds
+        """
+        if max_time is not None:
+            from time import perf_counter
+            start = perf_counter()
+        if max_nodes is None:
+            max_nodes = 1 if max_time is None else sys.maxsize
+        sink = self._sink(write)
+        if sink is not None:
+            write = sink.write
+
+        if document:
+            self.serialize_document_start(write)
+        nodes = 0
+        for _ in self._serialize_steps(write, element, _QNames(self), {}):
+            nodes += 1
+            if nodes >= max_nodes or (max_time is not None and
+                                      perf_counter() - start >= max_time):
+                if sink is not None:
+                    sink.flush()
+                yield
+                nodes = 0
+                if max_time is not None:
+                    start = perf_counter()
+        if sink is not None:
+            sink.flush(final=True)
+
+
+    def iterwrite(self, element, document=False, chunk_size=65536):
+        """
+        Writes an element lazily, see tree.iterwrite.
+
+        This is a generator, yielding the output in blocks of at least
+        chunk_size characters, encoded if the writer has an encoding.
+        """
+        blocks = []
+        sink = BufferedSink(blocks.append, self.encoding, chunk_size)
+        write = sink.write
 
         if document:
-            self.serialize_document_start(write_encode)
-        self.serialize(write_encode, element, qnames, namespaces)
+            self.serialize_document_start(write)
+        for _ in self._serialize_steps(write, element, _QNames(self), {}):
+            if blocks:
+                yield from blocks
+                blocks.clear()
+        sink.flush(final=True)
+        yield from blocks
+
+
+    async def write_async(self, target, element, document=False, chunk_size=65536):
+        """
+        Writes an element to an asyncio stream.
+
+        The output is produced block by block, as by iterwrite.  After every
+        block, the coroutine waits for the stream to take it: it awaits
+        the drain method of a StreamWriter, or the call of a coroutine
+        function.  Serializing one block takes bounded time, and control
+        returns to the event loop after every block, so other tasks run
+        while a large tree is written.
+
+        @param target: asyncio.StreamWriter, or a coroutine function called
+            with every block
+        @param chunk_size: number of characters per block
+        @raise ValueError: target is a stream, which takes bytes, and the
+            writer has no encoding
+        """
+        import asyncio
+        drain = getattr(target, "drain", None)
+        if drain is not None and not self.encoding:
+            raise ValueError("writing to a stream needs an encoding")
+        for block in self.iterwrite(element, document, chunk_size):
+            if drain is not None:
+                target.write(block)
+                await drain()
+            else:
+                await target(block)
+            # drain returns without suspending while the buffer is low
+            await asyncio.sleep(0)
+
+
+class _QNames(dict):
+    # serialized names of the qnames, computed on first use.  The prefix of
+    # a namespace is fixed by the first use, so it is the same in all
+    # scopes it is declared in.
+
+    def __init__(self, writer):
+        dict.__init__(self)
+        self[None] = None
+        self.writer = writer
+        self.candidates = writer.namespaces
+        self.prefixes = {} # uri -> prefix
+        self.uris = {} # qname -> uri to declare
+        self.templates = {} # (tag, attribute keys) -> start tag template
+
+    def __missing__(self, qname):
+        if isinstance(qname, QName):
+            key = qname
+        elif isinstance(qname, str):
+            key = QName(qname)
+        else:
+            self.writer._raise_serialization_error(qname)
+        uri = key.uri
+        if uri is None:
+            # XXX: What happens with undefined namespace?
+            text = key.name
+        else:
+            prefix = self.prefixes.get(uri)
+            if prefix is None:
+                prefix = self.candidates.get(uri)
+                if prefix is None:
+                    prefix = "ns%d" % len(self.prefixes)
+                if prefix == "xml":
+                    uri = None
+                else:
+                    self.prefixes[uri] = prefix
+            if prefix:
+                text = "{}:{}".format(prefix, key.name)
+            else:
+                text = key.name
+            if uri is not None:
+                self.uris[qname] = uri
+        self[qname] = text
+        return text
 
 
 class TextWriter(BaseWriter):
@@ -1275,24 +2585,53 @@ class TextWriter(BaseWriter):
         for part in elem.itertext():
             write(part)
 
+    def _serialize_steps(self, write, elem, qnames, namespaces):
+        for part in elem.itertext():
+            write(part)
+            yield
+
 
 class MLBaseWriter(BaseWriter):
     """stuff HTML / XML writers have in common"""
-    def _attrib_string(self, d, qnames):
-        """create a attribute string from a dict d"""
-        if not d:
-            return ''
-        items = sorted(d.items(), key=lambda x: x[0])
-        result = []
-        for k, v in items:
-            k = qnames[k]
-            if isinstance(v, QName):
-                v = qnames[v]
+    def _start_template(self, tag, keys, qnames):
+        # the constant parts of a start tag: "<tag" and for every
+        # attribute ' name="' with its key, in the written order
+        names = []
+        for k in self._attribute_order(keys):
+            names.append((' %s="' % qnames[k], k))
+        return "<" + qnames[tag], names
+
+    def _start_tag(self, elem, qnames, namespaces):
+        """
+        Returns the start tag of an element without the closing ">".
+
+        The constant parts are prepared once per tag and attribute keys in
+        a write call, so only the attribute values are filled in.
+        """
+        attrib = elem.attrib
+        key = elem.tag, tuple(attrib) if attrib else ()
+        template = qnames.templates.get(key)
+        if template is None:
+            template = qnames.templates[key] = self._start_template(key[0], key[1], qnames)
+        start, names = template
+        if not names and not namespaces:
+            return start
+        parts = [start]
+        append = parts.append
+        escape = self._escape_attrib
+        for name, k in names:
+            v = attrib[k]
+            append(name)
+            if v.__class__ is str:
+                append(escape(v))
+            elif isinstance(v, QName):
+                append(qnames[v])
             else:
-                v = self._escape_attrib(str(v))
-            # FIXME: handle boolean attributes for HTML
-            result.append(' {}="{}"'.format(k, v))
-        return ''.join(result)
+                append(escape(str(v)))
+            append('"')
+        if namespaces:
+            append(self._namespace_string(namespaces))
+        return "".join(parts)
 
     def _namespace_string(self, d):
         """create a namespace string from a dict d"""
@@ -1306,9 +2645,166 @@ class MLBaseWriter(BaseWriter):
             result.append(' xmlns{}="{}"'.format(k, self._escape_attrib(v)))
         return ''.join(result)
 
-    def _serialize_element(self, write, elem, qnames, namespaces):
+    def _serialize_start(self, write, elem, qnames, namespaces):
+        """
+        Writes the start of an element.
+
+        @return: the end of the element, written after the children, or
+            None if the element is already written completely
+        """
         raise NotImplementedError
 
+    def _serialize_element(self, write, elem, qnames, namespaces):
+        # namespaces maps the uris declared by the ancestors to prefixes.
+        # The open elements are kept on an explicit stack instead of
+        # recursing, so any depth can be written.
+        if self.fragments is not None:
+            return self._serialize_fragments(write, elem, qnames, namespaces)
+        declarations = self._declarations
+        serialize_start = self._serialize_start
+        escape = self._escape_cdata
+        stack = [] # (children, end, namespaces) of the open parents
+        children = iter((elem, ))
+        end = None
+        while True:
+            for node in children:
+                if node.__class__ is str:
+                    write(escape(node))
+                elif isinstance(node, Element):
+                    declare = declarations(node, qnames, namespaces)
+                    if declare:
+                        scope = namespaces.copy()
+                        scope.update(declare)
+                    else:
+                        scope = namespaces
+                    node_end = serialize_start(write, node, qnames, declare)
+                    if node_end is not None:
+                        stack.append((children, end, namespaces))
+                        children, end, namespaces = iter(node), node_end, scope
+                        break
+                else:
+                    self.serialize(write, node, qnames, namespaces)
+            else:
+                if end:
+                    write(end)
+                if not stack:
+                    return
+                children, end, namespaces = stack.pop()
+
+    def _serialize_fragments(self, write, elem, qnames, namespaces):
+        for _ in self._fragment_steps(write, elem, qnames, namespaces):
+            pass
+
+    def _fragment_steps(self, write, elem, qnames, namespaces):
+        # like _serialize_steps, but the output of the elements selected
+        # by the fragment cache is taken from it or stored into it.  While
+        # a selected element is written, all output goes to a list, from
+        # which the fragments of it and its selected descendants are cut.
+        cache = self.fragments
+        select = cache.select
+        config = self.__class__, self.sort_attributes, frozenset(self.namespaces.items())
+        fingerprints = {} # id(element) -> fingerprint, for this call
+        prefixes = qnames.prefixes
+        declarations = self._declarations
+        serialize_start = self._serialize_start
+        escape = self._escape_cdata
+        out = []
+        output = write
+        stack = [] # (children, end, namespaces, capture) of the open parents
+        children = iter((elem, ))
+        end = capture = None
+        while True:
+            for node in children:
+                if node.__class__ is str:
+                    output(escape(node))
+                    yield
+                elif isinstance(node, Element):
+                    node_capture = None
+                    if node.tag is not None and (select is None or select(node)):
+                        # the output also depends on the namespaces in scope
+                        # and the prefixes fixed so far
+                        key = (cache.fingerprint(node, fingerprints), config,
+                               frozenset(namespaces.items()), frozenset(prefixes.items()))
+                        entry = cache.get(key)
+                        if entry is not None:
+                            text, added = entry
+                            output(text)
+                            prefixes.update(added)
+                            yield
+                            continue
+                        node_capture = len(out), key, len(prefixes)
+                        output = out.append
+                    declare = declarations(node, qnames, namespaces)
+                    if declare:
+                        scope = namespaces.copy()
+                        scope.update(declare)
+                    else:
+                        scope = namespaces
+                    node_end = serialize_start(output, node, qnames, declare)
+                    if node_end is not None:
+                        stack.append((children, end, namespaces, capture))
+                        children, end, namespaces, capture = iter(node), node_end, scope, node_capture
+                        yield
+                        break
+                    if node_capture is not None:
+                        output = self._store_fragment(write, out, node_capture, prefixes)
+                    yield
+                else:
+                    self.serialize(output, node, qnames, namespaces)
+                    yield
+            else:
+                if end:
+                    output(end)
+                if capture is not None:
+                    output = self._store_fragment(write, out, capture, prefixes)
+                if not stack:
+                    return
+                children, end, namespaces, capture = stack.pop()
+
+    def _store_fragment(self, write, out, capture, prefixes):
+        # stores the output of a selected element, and returns the write
+        # function for the following output
+        start, key, count = capture
+        text = "".join(out[start:])
+        added = dict(list(prefixes.items())[count:])
+        self.fragments.put(key, text, added)
+        if start == 0:
+            out.clear()
+            write(text)
+            return write
+        # the enclosing element is still written into the list
+        del out[start:]
+        out.append(text)
+        return out.append
+
+    def _serialize_steps(self, write, elem, qnames, namespaces):
+        if self.fragments is not None:
+            yield from self._fragment_steps(write, elem, qnames, namespaces)
+            return
+        work = [(iter((elem, )), None, namespaces)]
+        while work:
+            children, end, namespaces = work[-1]
+            for node in children:
+                break
+            else:
+                work.pop()
+                if end:
+                    write(end)
+                continue
+            if isinstance(node, Element):
+                declare = self._declarations(node, qnames, namespaces)
+                if declare:
+                    scope = namespaces.copy()
+                    scope.update(declare)
+                else:
+                    scope = namespaces
+                end = self._serialize_start(write, node, qnames, declare)
+                if end is not None:
+                    work.append((iter(node), end, scope))
+            else:
+                self.serialize(write, node, qnames, namespaces)
+            yield
+
     def _serialize_comment(self, write, elem):
         write("<!--%s-->" % self._escape_cdata(elem.text))
 
@@ -1328,28 +2824,26 @@ class MLBaseWriter(BaseWriter):
             self._serialize_comment(write, elem)
         elif isinstance(elem, ProcessingInstruction):
             self._serialize_pi(write, elem)
+        elif isinstance(elem, ChunkedText):
+            for chunk in elem:
+                write(self._escape_cdata(chunk))
         else:
             self._serialize_cdata(write, elem)
 
 
 class XMLWriter(MLBaseWriter):
-    def _serialize_element(self, write, elem, qnames, namespaces):
+    def _serialize_start(self, write, elem, qnames, namespaces):
         tag = qnames[elem.tag]
 
         if tag is not None:
-            attrib_str = self._attrib_string(elem.attrib, qnames)
-            namespace_str = self._namespace_string(namespaces)
+            start = self._start_tag(elem, qnames, namespaces)
             if len(elem):
-                write("<{}{}{}>".format(tag, attrib_str, namespace_str))
-                for e in elem:
-                    self.serialize(write, e, qnames)
-                write("</%s>" % tag)
-            else:
-                write("<{}{}{} />".format(tag, attrib_str, namespace_str))
+                write(start + ">")
+                return "</%s>" % tag
+            write(start + " />")
+            return None
 
-        else:
-            for e in elem:
-                self.serialize(write, e, qnames)
+        return ""
 
     def serialize_document_start(self, write):
         if self.encoding and self.encoding not in ("utf-8", "us-ascii"):
@@ -1360,28 +2854,26 @@ class HTMLWriter(MLBaseWriter):
     empty_elements = frozenset(("area", "base", "basefont", "br", "col", "frame", "hr",
                                 "img", "input", "isindex", "link", "meta" "param"))
 
-    def __init__(self, encoding=None, namespaces={}):
+    def __init__(self, encoding=None, namespaces={}, sort_attributes=True, fragments=None):
+        namespaces = dict(namespaces)
         namespaces["http://www.w3.org/1999/xhtml"] = ''
-        super().__init__(encoding, namespaces)
+        super().__init__(encoding, namespaces, sort_attributes, fragments)
 
-    def _serialize_element(self, write, elem, qnames, namespaces):
+    def _serialize_start(self, write, elem, qnames, namespaces):
         tag = qnames[elem.tag]
 
         if tag is not None:
-            attrib_str = self._attrib_string(elem.attrib, qnames)
-            namespace_str = self._namespace_string(namespaces)
-            write("<{}{}{}>".format(tag, attrib_str, namespace_str))
+            write(self._start_tag(elem, qnames, namespaces) + ">")
+            end = "" if tag in self.empty_elements else "</%s>" % tag
             if tag.lower() in ('script', 'style'):
-                write(''.join(elem.itertext()))
-            else:
-                for e in elem:
-                    self.serialize(write, e, qnames)
-            if tag not in self.empty_elements:
-                write("</%s>" % tag)
+                for text in elem.itertext():
+                    write(text)
+                if end:
+                    write(end)
+                return None
+            return end
 
-        else:
-            for e in elem:
-                self.serialize(write, e, qnames)
+        return ""
 
 
 class PolyglotWriter(MLBaseWriter):
@@ -1391,30 +2883,173 @@ class PolyglotWriter(MLBaseWriter):
                                'img', 'input', 'keygen', 'link', 'meta', 'param',
                                'source', 'track', 'wbr'))
 
-    def __init__(self, encoding=None, namespaces={}):
+    def __init__(self, encoding=None, namespaces={}, sort_attributes=True, fragments=None):
+        namespaces = dict(namespaces)
         namespaces["http://www.w3.org/1999/xhtml"] = ''
-        super().__init__(encoding, namespaces)
+        super().__init__(encoding, namespaces, sort_attributes, fragments)
 
-    def _serialize_element(self, write, elem, qnames, namespaces):
+    def _serialize_start(self, write, elem, qnames, namespaces):
         tag = qnames[elem.tag]
 
         if tag is not None:
-            attrib_str = self._attrib_string(elem.attrib, qnames)
-            namespace_str = self._namespace_string(namespaces)
+            start = self._start_tag(elem, qnames, namespaces)
             if len(elem):
-                write("<{}{}{}>".format(tag, attrib_str, namespace_str))
-                for e in elem:
-                    self.serialize(write, e, qnames)
-                write("</%s>" % tag)
+                write(start + ">")
+                return "</%s>" % tag
             elif tag in self.void_elements:
-                write("<{}{}{} />".format(tag, attrib_str, namespace_str))
+                write(start + " />")
             else:
-                write("<{}{}{}></{}>".format(tag, attrib_str, namespace_str, tag))
+                write("{}></{}>".format(start, tag))
+            return None
 
-        else:
-            for e in elem:
-                self.serialize(write, e, qnames)
+        return ""
 
     def serialize_document_start(self, write):
         write("<!DOCTYPE html>\n")
 
+
+def _escape_c14n_cdata(text):
+    if "&" in text:
+        text = text.replace("&", "&amp;")
+    if "<" in text:
+        text = text.replace("<", "&lt;")
+    if ">" in text:
+        text = text.replace(">", "&gt;")
+    if "\r" in text:
+        text = text.replace("\r", "&#xD;")
+    return text
+
+def _escape_c14n_attrib(text):
+    if "&" in text:
+        text = text.replace("&", "&amp;")
+    if "<" in text:
+        text = text.replace("<", "&lt;")
+    if "\"" in text:
+        text = text.replace("\"", "&quot;")
+    if "\t" in text:
+        text = text.replace("\t", "&#x9;")
+    if "\n" in text:
+        text = text.replace("\n", "&#xA;")
+    if "\r" in text:
+        text = text.replace("\r", "&#xD;")
+    return text
+
+def _c14n_attribute_key(key):
+    # attributes are sorted by namespace uri, unqualified ones first, and
+    # local name
+    if not isinstance(key, QName):
+        key = QName(key)
+    return key.uri or "", key.name
+
+class C14NWriter(MLBaseWriter):
+    """
+    Writes canonical XML, following Canonical XML 1.1 and Exclusive XML
+    Canonicalization as far as an element tree allows.  Equal trees are
+    written equally, independent of the attribute order, so the output
+    is suited for digests.
+
+    - the output is encoded in utf-8, if it is encoded
+    - empty elements are written as start and end tag
+    - namespace declarations come before the attributes, sorted by prefix;
+      the attributes are sorted by namespace uri and local name
+    - characters are escaped as defined by C14N
+    - comments are left out, processing instructions are written as is
+
+    The trees do not keep the prefixes of the parsed document, so the
+    prefixes are assigned like by the other writers, from the preferred
+    prefixes or numbered in document order.  As in exclusive
+    canonicalization, a namespace is declared on the first element using
+    it.  No default namespace is used.
+    """
+
+    _escape_cdata = staticmethod(_escape_c14n_cdata)
+    _escape_attrib = staticmethod(_escape_c14n_attrib)
+
+    def __init__(self, encoding=None, namespaces={}, sort_attributes=True, fragments=None):
+        if encoding:
+            encoding = "utf-8"
+        # unqualified elements can not be written inside a default namespace
+        namespaces = {uri: prefix for uri, prefix in namespaces.items() if prefix}
+        super().__init__(encoding, namespaces, True, fragments)
+
+    def _attribute_order(self, keys):
+        order = self._orders.get(keys)
+        if order is None:
+            order = tuple(sorted(keys, key=_c14n_attribute_key))
+            if len(self._orders) >= self.attribute_orders_size:
+                self._orders.clear()
+            self._orders[keys] = order
+        return order
+
+    def _serialize_start(self, write, elem, qnames, namespaces):
+        tag = qnames[elem.tag]
+
+        if tag is not None:
+            # like _start_tag, but the namespace declarations come first
+            attrib = elem.attrib
+            key = elem.tag, tuple(attrib) if attrib else ()
+            template = qnames.templates.get(key)
+            if template is None:
+                template = qnames.templates[key] = self._start_template(key[0], key[1], qnames)
+            start, names = template
+            parts = [start]
+            append = parts.append
+            if namespaces:
+                append(self._namespace_string(namespaces))
+            escape = self._escape_attrib
+            for name, k in names:
+                v = attrib[k]
+                append(name)
+                if v.__class__ is str:
+                    append(escape(v))
+                elif isinstance(v, QName):
+                    append(qnames[v])
+                else:
+                    append(escape(str(v)))
+                append('"')
+            if len(elem):
+                append(">")
+                write("".join(parts))
+                return "</%s>" % tag
+            append("></%s>" % tag)
+            write("".join(parts))
+            return None
+
+        return ""
+
+    def _serialize_comment(self, write, elem):
+        pass
+
+    def _serialize_pi(self, write, elem):
+        if elem.text:
+            write("<?{} {}?>".format(elem.target, elem.text))
+        else:
+            write("<?%s?>" % elem.target)
+
+
+def _writer_class(method):
+    if not method or method == "xml":
+        return XMLWriter
+    elif method == "html":
+        return HTMLWriter
+    elif method == "polyglot":
+        return PolyglotWriter
+    elif method == "c14n":
+        return C14NWriter
+    return TextWriter
+
+# writers without preferred namespace prefixes, shared by Node.write
+_writers = {}
+
+def _writer(method, encoding, namespaces, sort_attributes, fragments=None):
+    Writer = _writer_class(method)
+    if fragments is not None:
+        return Writer(encoding, namespaces, sort_attributes, fragments)
+    if namespaces:
+        return Writer(encoding, namespaces, sort_attributes)
+    key = Writer, encoding, sort_attributes
+    writer = _writers.get(key)
+    if writer is None:
+        writer = _writers[key] = Writer(encoding, namespaces, sort_attributes)
+    return writer
+